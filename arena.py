@@ -0,0 +1,467 @@
+'''
+Arena: many snakes on one board
+
+Two human snakes (the arrow keys and WASD, see config.control_sets) and/or
+hundreds of AI snakes share one board and move simultaneously each tick:
+
+- a snake moving off the board dies ('wall')
+- snakes whose heads meet on a cell all die ('head-on')
+- a snake moving into a body dies ('ate itself' or 'hit snake'); tails
+  moving away this tick don't count
+- food is eaten by the snake that moves onto it
+
+A shared occupancy grid holds the id of the snake on each cell, so resolving
+a tick is O(snakes) rather than O(snakes^2). AI snakes follow planner paths,
+or with `--planner field` all descend one distance field to the food, kept
+up to date as the snakes move (see field.py).
+
+    python -m arena --humans 2 --ai 20
+    python -m arena --headless --ai 300 --planner astar bfs --moves 2000
+'''
+import argparse
+import collections
+import colorsys
+import logging
+import random
+import time
+
+import numpy as np
+
+import board
+import cells as cells_mod
+import config
+import engine
+import field as field_mod
+import planner as planner_mod
+import snake
+
+
+NONE = -1   # Occupancy of an empty cell
+
+
+class ArenaSnake(snake.Snake):
+    '''A snake in an arena, steered by its controller'''
+    def __init__(self, sid, pos, direction, capacity, controller=None):
+        super().__init__([pos])
+        self.pos.set_capacity(capacity)
+        self.id = sid
+        self.direction = direction
+        self.controller = controller
+        self.alive = True
+        self.cause = None
+        self.eaten = 0
+
+
+class Occupied(object):
+    '''The arena's occupied cells, as a `blocked` container for planners'''
+    __slots__ = ('owner',)
+
+    def __init__(self, arena):
+        self.owner = arena.owner
+
+    def __contains__(self, pos):
+        return self.owner[pos[1], pos[0]] != NONE
+
+    def cell_mask(self, cells):
+        return cells.mask_from_array(self.owner.ravel() != NONE)
+
+
+class Arena(object):
+    '''
+    Snakes sharing a width x length board
+
+    Dead snakes are removed from the board; with respawn=True they come back
+    (as new snakes with the same controller) on the next tick.
+    '''
+    def __init__(self, width=None, length=None, food_count=1, seed=None,
+                 capacity=3, respawn=False):
+        self.width = width or config.board_size // config.space_dim[0]
+        self.length = length or config.board_size // config.space_dim[1]
+        self.food_count = food_count
+        self.capacity = capacity
+        self.respawn = respawn
+        self.rng = random.Random(seed)
+
+        self.cells = cells_mod.get_cells(self.width, self.length)
+        self.owner = np.full((self.length, self.width), NONE, dtype=np.int32)
+        self.occupied = Occupied(self)
+        self.free = board.FreeCells(self.width, self.length)    # Of cells
+        self.foods = {}         # Food positions, oldest first
+        self.snakes = {}        # id -> ArenaSnake (alive)
+        self.deaths = collections.Counter()
+        self.changed = set()    # Cells changed since the last clear
+        self.field = None       # Distance field to the food, if enabled
+        self.tick = 0
+        self._next_id = 0
+
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def is_inside(self, pos):
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.length
+
+    def _occupy(self, pos, sid):
+        self.owner[pos[1], pos[0]] = sid
+        self.free.remove(self.cells.cell(pos))
+        self.changed.add(pos)
+        if self.field is not None:
+            self.field.block(pos)
+
+    def _vacate(self, pos):
+        self.owner[pos[1], pos[0]] = NONE
+        self.free.add(self.cells.cell(pos))
+        self.changed.add(pos)
+        if self.field is not None:
+            self.field.free(pos)
+
+    def enable_field(self):
+        '''Keep a `field.DistanceField` to the food from now on'''
+        if self.field is None:
+            self.field = field_mod.DistanceField(self.width, self.length)
+            self.field.reset(self.foods, self.occupied)
+        return self.field
+
+    def spawn(self, controller=None):
+        '''Add a snake on a random free cell, return it (None if full)'''
+        if len(self.free) == 0:
+            return None
+        pos = self.cells.positions[self.free.choice(self.rng)]
+        s = ArenaSnake(self._next_id, pos, self.rng.choice(engine.ACTIONS),
+                       self.capacity, controller)
+        self._next_id += 1
+        self.snakes[s.id] = s
+        self._occupy(pos, s.id)
+        return s
+
+    def place_food(self):
+        while len(self.foods) < self.food_count and len(self.free) > 0:
+            cell = self.free.choice(self.rng)
+            pos = self.cells.positions[cell]
+            self.foods[pos] = None
+            self.free.remove(cell)
+            self.changed.add(pos)
+            if self.field is not None:
+                self.field.add_target(pos)
+
+    def nearest_food(self, pos):
+        return min(
+            self.foods,
+            key=lambda f: abs(f[0] - pos[0]) + abs(f[1] - pos[1]),
+            default=None,
+        )
+
+    def step(self, actions=None):
+        '''
+        Move every snake at once
+
+        actions maps snake ids to directions; snakes without one ask their
+        controller, then keep their direction (as do snakes turning back onto
+        their neck). Returns the snakes that died, with their cause set.
+        '''
+        actions = actions or {}
+        snakes = list(self.snakes.values())
+
+        # Where each snake's head goes, and how many heads go to each cell
+        nexts = {}
+        heads = collections.Counter()
+        for s in snakes:
+            action = actions.get(s.id)
+            if action is None and s.controller is not None:
+                action = s.controller(self, s)
+            if action is not None and (
+                    len(s) == 1 or action != engine.OPPOSITES[s.direction]):
+                s.direction = action
+            dx, dy = engine.DELTAS[s.direction]
+            x, y = s.head()
+            nexts[s.id] = nxt = (x + dx, y + dy)
+            heads[nxt] += 1
+
+        # Tails moving away this tick (the snake isn't growing)
+        leaving = {
+            s.last() for s in snakes
+            if s.pos.at_capacity() and nexts[s.id] not in self.foods
+        }
+
+        dead = []
+        for s in snakes:
+            nxt = nexts[s.id]
+            if not self.is_inside(nxt):
+                s.cause = 'wall'
+            elif heads[nxt] > 1:
+                s.cause = 'head-on'
+            else:
+                sid = self.owner[nxt[1], nxt[0]]
+                if sid != NONE and nxt not in leaving:
+                    s.cause = 'ate itself' if sid == s.id else 'hit snake'
+            if s.cause is not None:
+                dead.append(s)
+
+        # Move the survivors' tails, clear the dead, then place new heads
+        for s in dead:
+            s.alive = False
+            del self.snakes[s.id]
+            self.deaths[s.cause] += 1
+            for pos in s.pos:
+                if self.owner[pos[1], pos[0]] == s.id:
+                    self._vacate(pos)
+
+        moved = []
+        for s in snakes:
+            if not s.alive:
+                continue
+            nxt = nexts[s.id]
+            if nxt in self.foods:
+                del self.foods[nxt]
+                if self.field is not None:
+                    self.field.remove_target(nxt)
+                s.grow(1)
+                s.eaten += 1
+            tail = s.add(nxt)
+            if tail is not None and self.owner[tail[1], tail[0]] == s.id:
+                self._vacate(tail)
+            moved.append(s)
+        for s in moved:
+            self._occupy(s.head(), s.id)
+
+        if self.respawn:
+            for s in dead:
+                self.spawn(s.controller)
+        self.place_food()
+        self.tick += 1
+        return dead
+
+
+class ArenaAI(object):
+    '''
+    Steers a snake along planner paths to the nearest food
+
+    Paths are replanned when the next step is blocked, the food is gone or
+    the path runs out; other snakes are obstacles. Only non-incremental
+    planners fit, as the board changes every tick without notice.
+    '''
+    def __init__(self, planner='astar'):
+        self.planner = planner if isinstance(planner, planner_mod.Planner) \
+            else planner_mod.get_planner(planner)
+        if self.planner.incremental or self.planner.safe:
+            raise ValueError(
+                f'Planner {self.planner.name!r} follows a single snake, '
+                'it can\'t be used in the arena'
+            )
+        self.path = None
+        self.step = 0
+        self.plans = 0
+
+    def __call__(self, arena, s):
+        head = s.head()
+        path, i = self.path, self.step + 1
+        if not (path and i < len(path) and path[i - 1] == head
+                and path[-1] in arena.foods and path[i] not in arena.occupied):
+            target = arena.nearest_food(head)
+            if target is None:
+                return self.fallback(arena, s)
+            self.plans += 1
+            self.path = path = self.planner.find_path(
+                head, target, arena.occupied, arena.width, arena.length
+            )
+            i = 1
+            if len(path) < 2:
+                self.path = None
+                return self.fallback(arena, s)
+
+        self.step = i
+        return engine.get_direction(head, path[i])
+
+    def fallback(self, arena, s):
+        '''Keep the current direction if its next cell is free, else turn'''
+        x, y = s.head()
+        order = [s.direction] + [a for a in engine.ACTIONS if a != s.direction]
+        for action in order:
+            dx, dy = engine.DELTAS[action]
+            nxt = (x + dx, y + dy)
+            if arena.is_inside(nxt) and nxt not in arena.occupied:
+                return action
+        return None
+
+
+class FieldAI(ArenaAI):
+    '''
+    Steers a snake downhill on the arena's distance field to the food
+
+    All FieldAI snakes share the field, which the arena repairs as snakes
+    move, so a move costs O(1) however many snakes there are.
+    '''
+    def __init__(self):
+        self.plans = 0
+
+    def __call__(self, arena, s):
+        nxt = arena.enable_field().descend(s.head())
+        if nxt is None:
+            return self.fallback(arena, s)
+        return engine.get_direction(s.head(), nxt)
+
+
+def get_controller(name):
+    '''An AI controller: a planner's name, or 'field' for `FieldAI`'''
+    return FieldAI() if name == 'field' else ArenaAI(name)
+
+
+def get_color(sid):
+    '''A distinct color per snake id'''
+    r, g, b = colorsys.hsv_to_rgb((sid * 0.618034) % 1, 0.75, 0.85)
+    return (int(r * 255), int(g * 255), int(b * 255))
+
+
+def run(n_ai, planners, width=None, length=None, moves=1000, food_count=None,
+        seed=None):
+    '''
+    Play n_ai AI snakes (planners assigned round-robin) for moves ticks,
+    respawning the dead; returns per-planner stats
+    '''
+    log = logging.getLogger('arena')
+    arena = Arena(width, length, food_count or max(n_ai // 2, 1), seed,
+                  respawn=True)
+    names = {}
+    for i in range(n_ai):
+        s = arena.spawn(get_controller(planners[i % len(planners)]))
+        names[s.controller] = planners[i % len(planners)]
+    arena.place_food()
+
+    deaths = {name: collections.Counter() for name in planners}
+    eaten = collections.Counter()
+    start = time.perf_counter()
+    for _ in range(moves):
+        for s in arena.step():
+            deaths[names[s.controller]][s.cause] += 1
+            eaten[names[s.controller]] += s.eaten
+        arena.changed.clear()
+    seconds = time.perf_counter() - start
+
+    plans = collections.Counter()
+    for controller, name in names.items():
+        plans[name] += controller.plans
+    for s in arena.snakes.values():
+        eaten[names[s.controller]] += s.eaten
+
+    log.info(f'{moves} ticks of {n_ai} snakes on a {arena.width}x'
+             f'{arena.length} board in {seconds:.2f}s '
+             f'({moves / seconds:.1f} ticks/s)')
+    stats = {}
+    for name in planners:
+        stats[name] = dict(
+            plans=plans[name], eaten=eaten[name], deaths=dict(deaths[name])
+        )
+        log.info(f'{name}: {plans[name]} plans, {eaten[name]} food eaten, '
+                 f'deaths {dict(deaths[name])}')
+    return stats
+
+
+class ArenaGame(object):
+    '''Plays an arena in a window, drawing only the cells that changed'''
+    def __init__(self, screen, humans=2, n_ai=0, planners=('astar',),
+                 food_count=None, seed=None):
+        import pygame
+
+        self.screen = screen
+        self.clock = pygame.time.Clock()
+        # Without humans, dead AI snakes respawn until the window is closed
+        self.arena = Arena(
+            food_count=food_count or max((humans + n_ai) // 2, 1),
+            seed=seed, respawn=not humans,
+        )
+
+        # Human snakes, steered by key sets ('right': arrows, 'left': WASD)
+        self.humans = {}
+        for name in ('right', 'left')[:humans]:
+            s = self.arena.spawn()
+            keys = config.control_sets[name]
+            self.humans[s.id] = {key: d for d, key in keys.items()}
+        for i in range(n_ai):
+            self.arena.spawn(get_controller(planners[i % len(planners)]))
+        self.arena.place_food()
+
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def _draw(self):
+        import pygame
+
+        arena = self.arena
+        dx, dy = config.space_dim
+        rects = []
+        for pos in arena.changed:
+            rect = pygame.Rect(pos[0] * dx, pos[1] * dy, dx, dy)
+            sid = arena.owner[pos[1], pos[0]]
+            if sid != NONE:
+                color = get_color(int(sid))
+            elif pos in arena.foods:
+                color = config.food_color
+            else:
+                color = config.background_color
+            pygame.draw.rect(self.screen, color, rect)
+            rects.append(rect)
+        arena.changed.clear()
+        return rects
+
+    def start(self):
+        import pygame
+
+        self.screen.fill(config.background_color)
+        pygame.display.update()
+
+        actions = {}
+        while self.arena.snakes and (not self.humans or any(
+                sid in self.arena.snakes for sid in self.humans)):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                if event.type == pygame.KEYDOWN:
+                    for sid, keys in self.humans.items():
+                        if event.key in keys:
+                            actions[sid] = keys[event.key]
+
+            for s in self.arena.step(actions):
+                who = 'Player' if s.id in self.humans else 'AI'
+                self.log.info(f'{who} snake {s.id} died: {s.cause} '
+                              f'(ate {s.eaten})')
+            actions = {}
+
+            pygame.display.update(self._draw())
+            self.clock.tick(config.speed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-arena')
+    parser.add_argument('--humans', type=int, default=2, choices=[0, 1, 2])
+    parser.add_argument('--ai', type=int, default=0,
+                        help='number of AI snakes')
+    parser.add_argument('--planner', nargs='+', default=['astar'],
+                        choices=['bfs', 'dijkstra', 'astar', 'field'])
+    parser.add_argument('--food', type=int, default=None,
+                        help='food items on the board at once '
+                             '(default: one per two snakes)')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--headless', action='store_true', default=False,
+                        help='simulate the AI snakes without a window')
+    parser.add_argument('--moves', type=int, default=1000,
+                        help='ticks to simulate when headless')
+    parser.add_argument('--board_size', type=int, default=config.board_size)
+    parser.add_argument('--space_dim', type=int, default=config.space_dim[0])
+    parser.add_argument('--debugging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    log_lvl = logging.DEBUG if args.debugging else logging.INFO
+    log_fmt = '[%(asctime)s] %(name)s %(levelname)s> %(message)s'
+    logging.basicConfig(format=log_fmt, level=log_lvl)
+
+    config.board_size = args.board_size
+    config.space_dim = (args.space_dim, args.space_dim)
+    if args.headless:
+        run(args.ai, args.planner, moves=args.moves, food_count=args.food,
+            seed=args.seed)
+    else:
+        import pygame
+
+        pygame.init()
+        screen = pygame.display.set_mode((config.board_size,) * 2)
+        pygame.display.set_caption('PySnake Arena')
+        ArenaGame(screen, args.humans, args.ai, args.planner, args.food,
+                  args.seed).start()
+        pygame.quit()
@@ -0,0 +1,191 @@
+'''
+Vectorized snake: N headless games stepped in lockstep with NumPy
+
+Follows the rules of `engine.SnakeEnv` (and so `player.Player` /
+`game.Game`), with every game's state held in arrays:
+
+- grids: (N, length, width) cell states, as in `board.Board.grid`
+- bodies: (N, width * length) ring buffers of flat cells (y * width + x),
+  with heads[i] the ring index of game i's head
+'''
+import numpy as np
+
+import config
+import engine
+
+
+# Cell states, as in board.Board.grid
+EMPTY = 0
+BODY = 1
+HEAD = 2
+FOOD = 3
+
+# Causes of a game ending
+ALIVE = 0
+WALL = 1
+ATE_ITSELF = 2
+BOARD_FULL = 3
+
+CAUSES = {ALIVE: None, WALL: 'wall', ATE_ITSELF: 'ate itself',
+          BOARD_FULL: 'board full'}
+
+# Actions are indices into engine.ACTIONS, or -1 to keep moving
+ACTIONS = engine.ACTIONS
+DX = np.array([engine.DELTAS[a][0] for a in ACTIONS], dtype=np.int64)
+DY = np.array([engine.DELTAS[a][1] for a in ACTIONS], dtype=np.int64)
+OPPOSITES = np.array(
+    [ACTIONS.index(engine.OPPOSITES[a]) for a in ACTIONS], dtype=np.int8
+)
+
+
+class BatchSnakeEnv(object):
+    '''
+    n games of snake stepped together
+
+    Finished games are reset automatically at the end of `step`, after their
+    final score, move count and cause have been reported.
+    '''
+    def __init__(self, n, width=None, length=None,
+                 starting_pos=config.starting_pos, seed=None):
+        self.n = n
+        self.width = width or config.board_size // config.space_dim[0]
+        self.length = length or config.board_size // config.space_dim[1]
+        self.size = self.width * self.length
+        self.starting_pos = list(starting_pos)
+
+        self.rng = np.random.default_rng(seed)
+        self._rows = np.arange(n)
+
+        self.grids = np.zeros((n, self.length, self.width), dtype=np.uint8)
+        self._cells = self.grids.reshape(n, self.size)     # Flat view
+        self.bodies = np.zeros((n, self.size), dtype=np.int64)
+        self.heads = np.zeros(n, dtype=np.int64)
+        self.lengths = np.zeros(n, dtype=np.int64)
+        self.capacities = np.zeros(n, dtype=np.int64)
+        self.directions = np.zeros(n, dtype=np.int8)
+        self.deactiv = np.full(n, -1, dtype=np.int8)
+        self.food = np.zeros(n, dtype=np.int64)
+        self.mv_cnt = np.zeros(n, dtype=np.int64)
+
+        start = [y * self.width + x for x, y in self.starting_pos]
+        self._start = np.array(start[::-1], dtype=np.int64)    # Tail first
+        self._start_dir = ACTIONS.index(engine.get_direction(
+            self.starting_pos[1], self.starting_pos[0]
+        ))
+
+        self.reset()
+
+    def reset(self, idx=None):
+        '''Start new games for the indices idx (default: all)'''
+        idx = self._rows if idx is None else np.asarray(idx)
+        k = len(self._start)
+
+        self._cells[idx] = EMPTY
+        self.bodies[idx, :k] = self._start
+        self._cells[idx[:, None], self._start] = BODY
+        self._cells[idx, self._start[-1]] = HEAD
+
+        self.heads[idx] = k - 1
+        self.lengths[idx] = k
+        self.capacities[idx] = k
+        self.directions[idx] = self._start_dir
+        self.deactiv[idx] = -1
+        self.mv_cnt[idx] = 0
+
+        self._place_food(idx)
+        return self.grids
+
+    def head_cells(self):
+        return self.bodies[self._rows, self.heads]
+
+    def get_scores(self):
+        return self.capacities * 100
+
+    def _place_food(self, idx):
+        '''
+        Put food on a uniformly random empty cell of each game in idx
+
+        Returns a mask over idx of the games with no empty cell left
+        '''
+        empty = self._cells[idx] == EMPTY
+        counts = empty.sum(axis=1)
+        full = counts == 0
+
+        # Pick the r-th empty cell of each board
+        r = (self.rng.random(len(idx)) * counts).astype(np.int64)
+        cells = np.argmax(np.cumsum(empty, axis=1) > r[:, None], axis=1)
+
+        self.food[idx] = cells
+        placed = idx[~full]
+        self._cells[placed, cells[~full]] = FOOD
+        return full
+
+    def step(self, actions):
+        '''
+        Move every game one step
+
+        actions is an array of n indices into ACTIONS (or -1 to keep going).
+        Returns (rewards, dones, info): rewards are 1 for eating, -1 for
+        dying and 0 otherwise, and info holds each game's final 'score',
+        'mv_cnt' and 'cause' (codes of CAUSES) before finished games reset.
+        '''
+        rows = self._rows
+        actions = np.asarray(actions)
+        self.mv_cnt += 1
+
+        # Turning back onto the neck keeps the snake going forward
+        dirs = np.where(actions >= 0, actions, self.directions).astype(np.int8)
+        dirs = np.where(dirs == self.deactiv, OPPOSITES[self.deactiv], dirs)
+        self.directions = dirs
+        self.deactiv = OPPOSITES[dirs]
+
+        heads = self.bodies[rows, self.heads]
+        nx = heads % self.width + DX[dirs]
+        ny = heads // self.width + DY[dirs]
+        outside = (nx < 0) | (nx >= self.width) \
+            | (ny < 0) | (ny >= self.length)
+        next_cells = np.where(outside, 0, ny * self.width + nx)
+
+        eat = ~outside & (next_cells == self.food)
+        self.capacities += eat
+
+        # Pop the tail of snakes at capacity before checking for collisions
+        pop = self.lengths == self.capacities
+        tails = self.bodies[rows, (self.heads - self.lengths + 1) % self.size]
+        self._cells[rows[pop], tails[pop]] = EMPTY
+        self.lengths -= pop
+
+        state = self._cells[rows, next_cells]
+        ate_itself = ~outside & ((state == BODY) | (state == HEAD))
+
+        # Push the new head
+        self._cells[rows, heads] = BODY
+        self.heads = (self.heads + 1) % self.size
+        self.bodies[rows, self.heads] = next_cells
+        self.lengths += 1
+        inside = rows[~outside]
+        self._cells[inside, next_cells[~outside]] = HEAD
+
+        causes = np.zeros(self.n, dtype=np.int8)
+        causes[outside] = WALL
+        causes[ate_itself] = ATE_ITSELF
+
+        rewards = eat.astype(np.int8)
+        rewards[causes != ALIVE] = -1
+
+        respawn = rows[eat & (causes == ALIVE)]
+        if len(respawn):
+            full = self._place_food(respawn)
+            causes[respawn[full]] = BOARD_FULL
+
+        dones = causes != ALIVE
+        info = dict(
+            score=self.get_scores(),
+            mv_cnt=self.mv_cnt.copy(),
+            cause=causes,
+        )
+
+        if dones.any():
+            self.reset(rows[dones])
+
+        return rewards, dones, info
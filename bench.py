@@ -0,0 +1,321 @@
+'''
+Benchmarks for the hot paths
+
+Times planning (`AIPlayer.find_path` per planner), movement
+(`FIFOQueue.add`, `Player.slither`), food placement (`Game.reset_food`) and
+drawing (`Board.draw`, `render.Renderer.draw`) on seeded scenarios: square
+boards of several sizes with an early, mid or late game snake laid out along
+a Hamiltonian cycle (`hamilton.build_cycle`), so it can keep moving without
+dying. Reports
+ops/sec, p50/p99 latency and peak traced memory per benchmark as JSON, which
+can be compared across commits:
+
+    python -m bench --out before.json
+    python -m bench --out after.json --compare before.json
+
+Drawing goes to an offscreen surface through SDL's dummy video driver.
+'''
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np      # noqa: E402
+import pygame           # noqa: E402
+
+import board            # noqa: E402
+import config           # noqa: E402
+import game             # noqa: E402
+import hamilton         # noqa: E402
+import planner          # noqa: E402
+import player           # noqa: E402
+import render           # noqa: E402
+import snake            # noqa: E402
+
+
+# Snake length as a fraction of the board's cells
+PHASES = dict(early=0.0, mid=0.25, late=0.75)
+
+# Boards are drawn at roughly this many pixels per side
+SCREEN_SIZE = 1200
+
+
+class Scenario(object):
+    '''
+    A board with a snake of a given length and food, built from a seed
+
+    Boards are drawn with config.space_dim set to the scenario's cell size
+    inside a `with scenario:` block, which restores it on exit.
+    '''
+    def __init__(self, cells, phase, seed=0):
+        if cells % 2:
+            raise ValueError(f'Expected an even board size, got: {cells}')
+        self.cells = cells
+        self.phase = phase
+        self.seed = seed
+        self.name = f'{cells}x{cells}/{phase}'
+        self.dim = max(SCREEN_SIZE // cells, 1)     # Pixels per cell side
+        self._space_dim = None
+
+    def __enter__(self):
+        self._space_dim = config.space_dim
+        config.space_dim = (self.dim, self.dim)
+        return self
+
+    def __exit__(self, *exc):
+        config.space_dim = self._space_dim
+
+    def build(self):
+        '''Set up the board, player and game for the scenario'''
+        if config.space_dim != (self.dim, self.dim):
+            raise RuntimeError('Build scenarios in a `with scenario:` block')
+
+        self.board = board.Board(self.cells * self.dim)
+        self.order = [self.board.cell(pos)
+                      for pos in hamilton.build_cycle(self.cells, self.cells)]
+        n = max(len(config.starting_pos),
+                int(PHASES[self.phase] * len(self.order)))
+
+        self.player = player.AIPlayer(self.board)
+        self.board.clear()
+        body = self.order[:n][::-1]     # Head first
+        self.player.pos = snake.FIFOQueue(
+            *body, capacity=len(body), size=self.board.cells.size + 1
+        )
+        for cell in body:
+            self.board.set_state(cell, board.BODY)
+        self.board.set_state(body[0], board.HEAD)
+        self.n = n
+        self.i = n      # Index in order of the next head position
+
+        self.game = game.Game(None, ai_player=True)
+        self.game.food_rng = random.Random(self.seed)
+        self.game.board = self.board
+        self.game.player = self.player
+        self.game.reset_food()
+        return self
+
+    def move(self):
+        '''Slither the player one step along the cycle'''
+        head = self.player.head()
+        nxt = self.order[self.i % len(self.order)]
+        self.player.slither(self.board.cells.direction(head, nxt))
+        self.i += 1
+
+
+class Result(object):
+    def __init__(self, name, scenario, latencies, peak):
+        latencies = np.asarray(latencies)
+        self.name = name
+        self.scenario = scenario
+        self.reps = len(latencies)
+        self.ops_per_sec = 1 / latencies.mean()
+        self.p50_us = np.percentile(latencies, 50) * 1e6
+        self.p99_us = np.percentile(latencies, 99) * 1e6
+        self.peak_kib = peak / 1024
+
+    def key(self):
+        return f'{self.name}[{self.scenario}]'
+
+    def to_dict(self):
+        return dict(
+            name=self.name,
+            scenario=self.scenario,
+            reps=self.reps,
+            ops_per_sec=round(float(self.ops_per_sec), 3),
+            p50_us=round(float(self.p50_us), 3),
+            p99_us=round(float(self.p99_us), 3),
+            peak_kib=round(self.peak_kib, 1),
+        )
+
+
+def measure(fn, batch=1, min_time=0.2, min_reps=3, max_reps=10000):
+    '''
+    Time fn() until min_time has passed (within [min_reps, max_reps])
+
+    Fast operations are timed in batches of `batch` calls; latencies are per
+    call. Peak memory is traced over one separate batch.
+    '''
+    fn()    # Warm up
+
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(batch):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_reps and (
+            len(latencies) < min_reps
+            or time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        for _ in range(batch):
+            fn()
+        latencies.append((time.perf_counter() - t) / batch)
+    return latencies, peak
+
+
+def bench_find_path(scenario, name, **kwargs):
+    '''One move plus a path from the new head to the food, per call'''
+    s = scenario.build()
+    s.player.planner = planner.get_planner(name)
+
+    def find_path():
+        s.move()
+        if s.game.food.cell not in s.board.foods:
+            # Eaten: keep the snake at the scenario's length
+            for cell in s.player.pos.set_capacity(s.n):
+                s.board.set_state(cell, board.EMPTY)
+            s.game.reset_food()
+        return s.player.find_path(s.game.food.cell)
+
+    return measure(find_path, **kwargs)
+
+
+def bench_queue_add(scenario, **kwargs):
+    s = scenario.build()
+    queue = s.player.pos
+    cells = itertools.cycle(range(s.board.cells.size))
+    return measure(lambda: queue.add(next(cells)), batch=1000, **kwargs)
+
+
+def bench_slither(scenario, **kwargs):
+    s = scenario.build()
+    return measure(s.move, batch=100, **kwargs)
+
+
+def bench_reset_food(scenario, **kwargs):
+    '''Eat the food and place a new one'''
+    s = scenario.build()
+
+    def reset_food():
+        s.board.foods.remove(s.game.food.cell)
+        s.game.reset_food()
+    return measure(reset_food, **kwargs)
+
+
+def bench_board_draw(scenario, **kwargs):
+    s = scenario.build()
+    screen = pygame.Surface((s.board._size, s.board._size))
+    return measure(lambda: s.board.draw(screen), **kwargs)
+
+
+def bench_render(scenario, **kwargs):
+    '''One move plus the incremental redraw, per frame'''
+    s = scenario.build()
+    screen = pygame.Surface((s.board._size, s.board._size))
+    renderer = render.Renderer(screen, s.board)
+    score = game.get_score_text(0)
+
+    def frame():
+        s.move()
+        renderer.draw(None, [score])
+
+    return measure(frame, **kwargs)
+
+
+BENCHMARKS = {
+    **{
+        f'find_path.{name}':
+            (lambda s, name=name, **kw: bench_find_path(s, name, **kw))
+        for name in planner.PLANNERS
+    },
+    'FIFOQueue.add': bench_queue_add,
+    'Player.slither': bench_slither,
+    'Game.reset_food': bench_reset_food,
+    'Board.draw': bench_board_draw,
+    'Renderer.draw': bench_render,
+}
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(boards, phases, names, seed=0, **kwargs):
+    results = []
+    for cells in boards:
+        for phase in phases:
+            scenario = Scenario(cells, phase, seed)
+            for name in names:
+                with scenario:
+                    latencies, peak = BENCHMARKS[name](scenario, **kwargs)
+                result = Result(name, scenario.name, latencies, peak)
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def print_result(result, baseline=None):
+    line = (f'{result.key():<45} {result.ops_per_sec:>14,.1f} ops/s  '
+            f'p50 {result.p50_us:>12,.1f}us  p99 {result.p99_us:>12,.1f}us  '
+            f'peak {result.peak_kib:>10,.1f}KiB')
+    if baseline is not None:
+        line += f'  x{result.ops_per_sec / baseline["ops_per_sec"]:.2f}'
+    print(line, flush=True)
+
+
+def compare(results, path):
+    '''Print each result's speedup over the matching result in path'''
+    with open(path) as f:
+        baseline = {
+            f'{r["name"]}[{r["scenario"]}]': r for r in json.load(f)['results']
+        }
+    print(f'\nCompared to {path}:')
+    for result in results:
+        if result.key() in baseline:
+            print_result(result, baseline[result.key()])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-bench')
+    parser.add_argument('--boards', nargs='+', type=int,
+                        default=[20, 100, 500], help='cells per side')
+    parser.add_argument('--phases', nargs='+', default=list(PHASES),
+                        choices=list(PHASES))
+    parser.add_argument('--only', nargs='+', default=list(BENCHMARKS),
+                        choices=list(BENCHMARKS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min_time', type=float, default=0.2,
+                        help='seconds to time each benchmark for')
+    parser.add_argument('--out', default=None, help='write results as JSON')
+    parser.add_argument('--compare', default=None,
+                        help='JSON results to compare against')
+    args = parser.parse_args()
+
+    pygame.init()
+    results = run(args.boards, args.phases, args.only, args.seed,
+                  min_time=args.min_time)
+
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump(dict(
+                commit=get_commit(),
+                python=platform.python_version(),
+                numpy=np.__version__,
+                pygame=pygame.version.ver,
+                results=[r.to_dict() for r in results],
+            ), f, indent=2)
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+    pygame.quit()
@@ -1,8 +1,30 @@
+import numpy as np
 import pygame
+
+import cells as cells_mod
 import config
 
 
+# Cell states of Board.grid
+EMPTY = 0
+BODY = 1
+HEAD = 2
+FOOD = 3
+WALL = 4    # State of the wall cell, off the board
+
+
+# Colors the cells are drawn in, per state
+STATE_COLORS = {
+    EMPTY: config.background_color,
+    BODY: config.snake_color,
+    HEAD: config.snake_head_color,
+    FOOD: config.food_color,
+}
+
+
 class GameObject(object):
+    __slots__ = ('pos', 'dim', 'color', 'rect')
+
     def __init__(self, position, dimensions, color=config.white):
         self.pos = position
         self.dim = dimensions
@@ -18,9 +40,50 @@ class GameObject(object):
         pygame.draw.rect(screen, color, self.rect)
 
 
-class Space(GameObject):
-    def __init__(self, x: int, y: int):
-        super().__init__((x, y), config.space_dim)
+class Space(object):
+    '''
+    A view of one cell of a Board, created on demand
+
+    Holds only the board and the cell (see cells.py): the cell's state, and
+    so its color, lives in Board.grid.
+    '''
+    __slots__ = ('board', 'cell')
+
+    def __init__(self, board, cell):
+        self.board = board
+        self.cell = cell
+
+    @property
+    def pos(self):
+        '''Screen position (pixels) of the space'''
+        x, y = self.board.cells.position(self.cell)
+        return (x * config.space_dim[0], y * config.space_dim[1])
+
+    @property
+    def dim(self):
+        return config.space_dim
+
+    @property
+    def state(self):
+        return self.board.get_state(self.cell)
+
+    @property
+    def color(self):
+        return STATE_COLORS[self.state]
+
+    def get_rect(self):
+        return pygame.Rect(*self.pos, *config.space_dim)
+
+    def draw(self, screen, color=None):
+        color = self.color if color is None else color
+        pygame.draw.rect(screen, color, self.get_rect())
+
+    def __eq__(self, other):
+        return isinstance(other, Space) and self.board is other.board \
+            and self.cell == other.cell
+
+    def __hash__(self):
+        return hash(self.cell)
 
     def __str__(self):
         return f'({self.pos[0]}, {self.pos[1]})'
@@ -29,28 +92,125 @@ class Space(GameObject):
         return self.__str__()
 
 
-class Board(object):
-    def __init__(self, size=config.board_size):
-        self._size = size
-        self._spaces = tuple(
-            tuple(
-                Space(x, y)
-                for x in range(0, self._size, config.space_dim[0])
-            ) for y in range(0, self._size, config.space_dim[1])
-        )
+class FoodRegistry(object):
+    '''
+    The food on a Board, kept in step with the board's grid
 
-    @property
-    def width(self):
-        return self._size // config.space_dim[0]
+    Cells are held oldest first in a dict, so adding, removing and
+    membership are O(1) and finding food never scans the board.
+    '''
+    __slots__ = ('board', '_cells')
 
-    @property
-    def length(self):
-        return self._size // config.space_dim[1]
+    def __init__(self, board):
+        self.board = board
+        self._cells = {}
+
+    def __len__(self):
+        return len(self._cells)
+
+    def __iter__(self):
+        return iter(self._cells)
+
+    def __contains__(self, cell):
+        return cell in self._cells
+
+    def add(self, cell):
+        self._cells[cell] = None
+        self.board.set_state(cell, FOOD)
+
+    def remove(self, cell):
+        '''Remove the food at cell (e.g. eaten), clearing it if unclaimed'''
+        del self._cells[cell]
+        if self.board.get_state(cell) == FOOD:
+            self.board.set_state(cell, EMPTY)
 
-    def __getitem__(self, pos):
-        if pos[0] < 0 or pos[1] < 0:
-            raise IndexError
-        return self._spaces[pos[1]][pos[0]]
+    def first(self):
+        '''The oldest food, or None'''
+        return next(iter(self._cells), None)
+
+    def nearest(self, cell):
+        '''The food closest to cell (Manhattan distance), or None'''
+        distance = self.board.cells.distance
+        return min(self._cells, key=lambda f: distance(f, cell), default=None)
+
+
+# Lives in cells.py, so the headless engine can use it without pygame
+FreeCells = cells_mod.FreeCells
+
+
+class Board(object):
+    '''
+    A grid of cells, each EMPTY, BODY, HEAD or FOOD
+
+    Cells are numbered y * width + x (see cells.py), with the sentinel cell
+    `cells.wall` off the board: its state is always WALL and setting it does
+    nothing, so a snake's head moving off the board needs no bounds checks.
+    The states are held in a compact array; `Space` views of cells are only
+    created when indexed, so even very large boards are cheap to build.
+    '''
+    __slots__ = ('_size', 'width', 'length', 'cells', 'grid', 'foods',
+                 'free', '_states')
+
+    def __init__(self, size=config.board_size):
+        self._size = size
+        self.width = size // config.space_dim[0]
+        self.length = size // config.space_dim[1]
+        self.cells = cells_mod.get_cells(self.width, self.length)
+
+        # Compact cell states (EMPTY, BODY, HEAD, FOOD) by cell, then the
+        # wall's; grid is the board's part as a (length, width) view
+        states = np.zeros(self.cells.size + 1, dtype=np.uint8)
+        states[self.cells.wall] = WALL
+        self.grid = states[:-1].reshape(self.length, self.width)
+        self._states = memoryview(states)  # Fast scalar access
+        self.foods = FoodRegistry(self)
+        self.free = FreeCells(self.width, self.length)     # EMPTY cells
+
+    def __getitem__(self, cell):
+        '''A `Space` view of cell, None for the wall'''
+        if cell == self.cells.wall:
+            return None
+        return Space(self, cell)
+
+    def cell(self, pos):
+        '''The cell at position pos, the wall if it's off the board'''
+        return self.cells.cell(pos)
+
+    def is_inside(self, cell):
+        return cell != self.cells.wall
+
+    def get_state(self, cell):
+        return self._states[cell]
+
+    def set_state(self, cell, state):
+        if cell == self.cells.wall:
+            return
+        old = self._states[cell]
+        self._states[cell] = state
+        if old == EMPTY and state != EMPTY:
+            self.free.remove(cell)
+        elif old != EMPTY and state == EMPTY:
+            self.free.add(cell)
+
+    def clear(self):
+        '''Empty every cell'''
+        self.grid[:] = EMPTY
+        self.free.reset()
+        self.foods = FoodRegistry(self)
+
+    def count(self, state=EMPTY):
+        '''Number of cells in the given state (default: free cells)'''
+        if state == EMPTY:
+            return len(self.free)
+        return int(np.count_nonzero(self.grid == state))
+
+    def find(self, state):
+        '''All cells in the given state, in board order'''
+        return np.flatnonzero(self.grid == state).tolist()
+
+    def snapshot(self):
+        '''Copy of the cell states'''
+        return self.grid.copy()
 
     def __repr__(self):
         return self.__str__()
@@ -59,18 +219,16 @@ class Board(object):
         out = ''
         for y in range(self.length):
             for x in range(self.width):
-                out += f'{self[x, y]}\t'
+                out += f'{self[y * self.width + x]}\t'
             out += '\n'
         return out
 
     def draw(self, screen):
-        for y in range(self.length):
-            for x in range(self.width):
-                self[x, y].draw(screen)
+        pygame.draw.rect(screen, STATE_COLORS[EMPTY],
+                         (0, 0, self._size, self._size))
+        for state in (BODY, HEAD, FOOD):
+            for cell in self.find(state):
+                self[cell].draw(screen)
 
     def __iter__(self):
-        return (
-            self[x, y]
-            for y in range(len(self._spaces))
-            for x in range(len(self._spaces[y]))
-        )
+        return (Space(self, cell) for cell in range(self.cells.size))
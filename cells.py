@@ -0,0 +1,228 @@
+'''
+Flat integer cells and precomputed adjacency
+
+The board, the snakes' bodies, collision checks and the planners all work on
+cells numbered y * width + x (the same order as a flattened
+`board.Board.grid`) instead of (x, y) tuples, so each move indexes lists and
+bytearrays rather than allocating and hashing tuples. Moves off the board
+lead to the sentinel cell `wall` (= width * length): a snake moving off the
+board lands on the wall, and every blocked mask marks it as blocked, so no
+bounds checks are needed.
+
+Stepping, directions and distances are arithmetic on the cells, so a board
+of any size costs nothing to number. The planners' lookups (the neighbor
+table and the per-cell lists and tuples built from it) are built the first
+time they're used, once per board size.
+
+(x, y) positions remain only in config, drawing and the arena; they are
+converted to cells with `cell` and `mask`, and back with `positions`, a list
+of the (shared) position tuples of the cells.
+'''
+import functools
+
+import numpy as np
+
+
+# Directions in the order of the neighbor table's columns
+DIRECTIONS = ('left', 'right', 'up', 'down')
+
+
+class Cells(object):
+    '''Cell numbering and neighbor tables for a width x length board'''
+    def __init__(self, width, length):
+        self.width = width
+        self.length = length
+        self.size = width * length
+        self.wall = self.size
+
+    @functools.cached_property
+    def table(self):
+        '''
+        (size + 1, 4) array of the neighbors in DIRECTIONS (the order the
+        planners try them in); the wall's neighbors are the wall
+        '''
+        width, length, wall = self.width, self.length, self.wall
+        xs, ys = np.meshgrid(np.arange(width), np.arange(length))
+        xs, ys = xs.ravel(), ys.ravel()
+        cells = np.arange(self.size)
+
+        table = np.full((self.size + 1, 4), wall, dtype=np.int32)
+        table[:-1, 0] = np.where(xs > 0, cells - 1, wall)
+        table[:-1, 1] = np.where(xs < width - 1, cells + 1, wall)
+        table[:-1, 2] = np.where(ys > 0, cells - width, wall)
+        table[:-1, 3] = np.where(ys < length - 1, cells + width, wall)
+        return table
+
+    @functools.cached_property
+    def neighbors(self):
+        '''Per cell, a tuple of its neighbors on the board (the wall: none)'''
+        wall = self.wall
+        return [tuple(nb for nb in row if nb != wall)
+                for row in self.table.tolist()]
+
+    @functools.cached_property
+    def positions(self):
+        '''The (shared) (x, y) position of each cell, None for the wall'''
+        return [(cell % self.width, cell // self.width)
+                for cell in range(self.size)] + [None]
+
+    @functools.cached_property
+    def _walls(self):
+        walls = bytearray(self.size + 1)
+        walls[self.wall] = 1
+        return walls
+
+    def cell(self, pos):
+        '''The cell at pos, or the wall if pos is off the board'''
+        x, y = pos
+        if 0 <= x < self.width and 0 <= y < self.length:
+            return y * self.width + x
+        return self.wall
+
+    def position(self, cell):
+        '''The (x, y) position of cell, None for the wall'''
+        if cell == self.wall:
+            return None
+        return (cell % self.width, cell // self.width)
+
+    def step(self, cell, direction):
+        '''The cell next to cell in direction (e.g. 'up'), maybe the wall'''
+        width, wall = self.width, self.wall
+        if cell == wall:
+            return wall
+        if direction == 'left':
+            return cell - 1 if cell % width else wall
+        if direction == 'right':
+            return cell + 1 if cell % width < width - 1 else wall
+        if direction == 'up':
+            return cell - width if cell >= width else wall
+        if direction == 'down':
+            return cell + width if cell < self.size - width else wall
+        raise ValueError(f'Unknown direction {direction!r}')
+
+    def direction(self, a, b):
+        '''
+        The direction (e.g. 'up') of the move from cell a to cell b
+
+        Moving onto the wall, it's the first direction in DIRECTIONS leading
+        off the board.
+        '''
+        for direction in DIRECTIONS:
+            if self.step(a, direction) == b:
+                return direction
+        raise ValueError(f'Cells {a} and {b} are not adjacent')
+
+    def distance(self, a, b):
+        '''Manhattan distance between the cells a and b'''
+        width = self.width
+        return abs(a % width - b % width) + abs(a // width - b // width)
+
+    def closed(self):
+        '''A bytearray over the cells, 1 only for the wall'''
+        return bytearray(self._walls)
+
+    def mask(self, blocked):
+        '''
+        A bytearray over the cells, 1 for the wall and cells in blocked
+
+        blocked is a container of positions; it may provide a faster
+        `cell_mask(cells)` returning the mask itself.
+        '''
+        cell_mask = getattr(blocked, 'cell_mask', None)
+        if cell_mask is not None:
+            return cell_mask(self)
+
+        mask = bytearray(self._walls)
+        width, length = self.width, self.length
+        for x, y in blocked:
+            if 0 <= x < width and 0 <= y < length:
+                mask[y * width + x] = 1
+        return mask
+
+    def mask_cells(self, blocked):
+        '''
+        A bytearray over the cells, 1 for the wall and the cells in blocked
+        (a container of cells, which may provide `cell_mask` as for `mask`)
+        '''
+        cell_mask = getattr(blocked, 'cell_mask', None)
+        if cell_mask is not None:
+            return cell_mask(self)
+
+        mask = bytearray(self._walls)
+        for cell in blocked:
+            mask[cell] = 1
+        return mask
+
+    def mask_from_array(self, blocked):
+        '''A mask from a flat bool array over the cells (without the wall)'''
+        return bytearray(np.append(blocked, True).astype(np.uint8))
+
+    def path(self, prev, start, target):
+        '''Walk the prev links (a dict) back from target to start'''
+        if target != start and target not in prev:
+            return []
+
+        path = [target]
+        node = target
+        while node != start:
+            node = prev[node]
+            path.append(node)
+        path.reverse()
+        return path
+
+
+class FreeCells(object):
+    '''
+    The empty cells of a board, for O(1) updates and uniform sampling
+
+    A permutation of the cells holds the free ones packed at the front,
+    alongside each cell's index in it. Removing a cell swaps it with the last
+    free one and adding swaps it with the first non-free one, so both are
+    O(1).
+    '''
+    __slots__ = ('_cells', '_index', '_n')
+
+    def __init__(self, width, length):
+        self._cells = np.arange(width * length, dtype=np.int32)
+        self._index = np.arange(width * length, dtype=np.int32)
+        self._n = width * length    # Number of free cells
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, cell):
+        return self._index[cell] < self._n
+
+    def _swap(self, i, j):
+        cells, index = self._cells, self._index
+        a, b = cells[i], cells[j]
+        cells[i], cells[j] = b, a
+        index[a], index[b] = j, i
+
+    def add(self, cell):
+        i = self._index[cell]
+        if i >= self._n:
+            self._swap(i, self._n)
+            self._n += 1
+
+    def remove(self, cell):
+        i = self._index[cell]
+        if i < self._n:
+            self._n -= 1
+            self._swap(i, self._n)
+
+    def reset(self):
+        '''Mark every cell free'''
+        self._n = len(self._cells)
+
+    def choice(self, rng):
+        '''A uniformly random free cell, drawn with rng (a random.Random)'''
+        if self._n == 0:
+            raise IndexError('No free cells')
+        return int(self._cells[rng.randrange(self._n)])
+
+
+@functools.lru_cache(maxsize=16)
+def get_cells(width, length):
+    '''The (shared) `Cells` of a width x length board'''
+    return Cells(width, length)
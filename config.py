@@ -1,4 +1,4 @@
-import pygame
+import os
 
 # colors
 white = (255, 255, 255)
@@ -17,20 +17,48 @@ space_dim = (60, 60)
 board_size = 1200
 
 speed = 4   # int from 1 to 10
+fps = 60    # Frames drawn per second, independent of the snake's speed
+max_catchup = 4     # Moves simulated per frame at most, after a stall
+turbo_levels = [1, 10, 100, 0]  # Speed multiples cycled by 't', 0: uncapped
+turbo_fps = 15      # Frames drawn per second in turbo mode
+profile_refresh = 0.25  # Seconds between updates of the 'o' frame timings
+
+search_budget = 0.05    # Seconds the lookahead AI (search.py) takes a move
+
+server_max_cells = 512 * 512    # Largest board a server session may ask for
 
 starting_pos = [(3, 3), (3, 2), (3, 1)]
 
-control_sets = dict(
-    left=dict(
-        up=pygame.K_w,
-        down=pygame.K_s,
-        left=pygame.K_a,
-        right=pygame.K_d
-    ),
-    right=dict(
-        up=pygame.K_UP,
-        down=pygame.K_DOWN,
-        left=pygame.K_LEFT,
-        right=pygame.K_RIGHT
+# Precomputed data (e.g. Hamiltonian cycles per board size)
+cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'py-snake')
+
+
+def get_control_sets():
+    '''
+    Key bindings per control set
+
+    pygame is imported here rather than at module level so the headless
+    simulation (engine.py) never loads it.
+    '''
+    import pygame
+
+    return dict(
+        left=dict(
+            up=pygame.K_w,
+            down=pygame.K_s,
+            left=pygame.K_a,
+            right=pygame.K_d
+        ),
+        right=dict(
+            up=pygame.K_UP,
+            down=pygame.K_DOWN,
+            left=pygame.K_LEFT,
+            right=pygame.K_RIGHT
+        )
     )
-)
\ No newline at end of file
+
+
+def __getattr__(name):
+    if name == 'control_sets':
+        return get_control_sets()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,354 @@
+'''
+Training data: transitions streamed to memory-mapped NumPy files
+
+Each transition is the observation before a move (the board's cell states,
+head and food positions, and the direction the snake was heading) and the
+move's action, reward and whether the game ended:
+
+    grid        uint8 (length, width)   cell states, as in board.Board.grid
+    head        int16 (2,)              (x, y)
+    food        int16 (2,)              (x, y), (-1, -1) without food
+    direction   int8                    index into engine.ACTIONS, -1 none
+    action      int8                    direction moved, -1 if it didn't move
+    reward      int8                    1 for eating, -1 for dying, else 0
+    done        bool                    the game ended with this move
+
+`Writer` writes them into chunks of chunk_size transitions, one
+preallocated `.npy` file per field and chunk (`np.lib.format.open_memmap`),
+so transitions are copied straight into the mapped files, one at a time
+(`observe` then `act`) or a batch of games at once (`extend`). index.json
+lists the chunks, how many transitions each holds and the episodes (games
+played one after another, as `game.Game --export` writes them). Exports of
+games in lockstep (`export`) interleave them instead: a game's next
+transition is meta['stride'] further on.
+
+`Dataset` maps the chunks read-only: fields are zero-copy views, and any
+transition or batch of transitions can be read without loading the rest.
+
+    python -m dataset export data --games 4096 --ticks 10000
+    python -m dataset info data
+'''
+import argparse
+import glob
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+import batch
+
+
+VERSION = 1
+INDEX = 'index.json'
+
+
+def get_fields(width, length):
+    '''{field: (dtype, shape of one transition)}'''
+    return dict(
+        grid=(np.uint8, (length, width)),
+        head=(np.int16, (2,)),
+        food=(np.int16, (2,)),
+        direction=(np.int8, ()),
+        action=(np.int8, ()),
+        reward=(np.int8, ()),
+        done=(np.bool_, ()),
+    )
+
+
+def chunk_path(path, chunk, field):
+    return os.path.join(path, f'chunk-{chunk:05d}.{field}.npy')
+
+
+class Writer(object):
+    '''Streams transitions of width x length games into the directory path'''
+    def __init__(self, path, width, length, chunk_size=2 ** 16, meta=None):
+        self.path = path
+        self.width = width
+        self.length = length
+        self.chunk_size = chunk_size
+        self.meta = meta or {}
+        self.fields = get_fields(width, length)
+
+        self.counts = []        # Transitions in each chunk
+        self.episodes = []      # (first transition, transitions) per game
+        self.total = 0
+        self._episode_start = 0
+        self._arrays = None     # The current chunk's memmaps, by field
+        self._i = 0             # Next row of the current chunk
+
+        # Chunks without an index are left by a writer that wasn't closed:
+        # writing over them would mix two exports
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, INDEX)) \
+                or glob.glob(os.path.join(glob.escape(path), 'chunk-*.npy')):
+            raise FileExistsError(f'{path} already holds a dataset')
+
+    def __len__(self):
+        return self.total
+
+    def _next_chunk(self):
+        if self._arrays is not None:
+            self._close_chunk()
+        chunk = len(self.counts)
+        self._arrays = {
+            name: np.lib.format.open_memmap(
+                chunk_path(self.path, chunk, name), mode='w+', dtype=dtype,
+                shape=(self.chunk_size,) + shape,
+            )
+            for name, (dtype, shape) in self.fields.items()
+        }
+        self.counts.append(0)
+        self._i = 0
+
+    def _close_chunk(self):
+        for array in self._arrays.values():
+            array.flush()
+        self._arrays = None
+        self.write_index()
+
+    def _row(self):
+        '''The current chunk and row to write to'''
+        if self._arrays is None or self._i == self.chunk_size:
+            self._next_chunk()
+        return self._arrays, self._i
+
+    def observe(self, grid, head, food, direction):
+        '''Write the observation of the next transition'''
+        arrays, i = self._row()
+        arrays['grid'][i] = grid
+        arrays['head'][i] = head
+        arrays['food'][i] = (-1, -1) if food is None else food
+        arrays['direction'][i] = direction
+
+    def act(self, action, reward, done):
+        '''Complete the transition started by `observe`'''
+        arrays, i = self._arrays, self._i
+        arrays['action'][i] = action
+        arrays['reward'][i] = reward
+        arrays['done'][i] = done
+        self._i += 1
+        self.counts[-1] += 1
+        self.total += 1
+
+    def extend(self, **columns):
+        '''
+        Write many transitions at once: columns are arrays of the fields
+        (all of them) over the transitions, e.g. a step of a batch of games
+        '''
+        n = len(columns['grid'])
+        done = 0
+        while done < n:
+            arrays, i = self._row()
+            k = min(n - done, self.chunk_size - i)
+            for name, values in columns.items():
+                arrays[name][i:i + k] = values[done:done + k]
+            self._i += k
+            self.counts[-1] += k
+            self.total += k
+            done += k
+
+    def end_episode(self):
+        '''Mark the transitions since the last call as one game'''
+        if self.total > self._episode_start:
+            self.episodes.append(
+                (self._episode_start, self.total - self._episode_start)
+            )
+        self._episode_start = self.total
+
+    def write_index(self):
+        index = dict(
+            version=VERSION,
+            width=self.width,
+            length=self.length,
+            chunk_size=self.chunk_size,
+            fields={
+                name: dict(dtype=np.dtype(dtype).str, shape=list(shape))
+                for name, (dtype, shape) in self.fields.items()
+            },
+            counts=self.counts,
+            episodes=self.episodes,
+            meta=self.meta,
+        )
+        tmp = os.path.join(self.path, INDEX + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, INDEX))
+
+    def close(self):
+        if self._arrays is not None:
+            self._close_chunk()
+        else:
+            self.write_index()
+
+
+class Dataset(object):
+    '''Read-only, memory-mapped view of a directory written by `Writer`'''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX)) as f:
+            index = json.load(f)
+        if index['version'] != VERSION:
+            raise ValueError(f'Unsupported dataset version {index["version"]}')
+
+        self.width = index['width']
+        self.length = index['length']
+        self.meta = index['meta']
+        self.counts = index['counts']
+        self.episodes = np.array(index['episodes'], dtype=np.int64) \
+            .reshape(-1, 2)
+        self.fields = list(index['fields'])
+
+        # Per field, the chunks' arrays trimmed to the rows written
+        self.chunks = {
+            name: [
+                np.load(chunk_path(path, chunk, name), mmap_mode='r')[:count]
+                for chunk, count in enumerate(self.counts)
+            ]
+            for name in self.fields
+        }
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)]) \
+            .astype(np.int64)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def locate(self, i):
+        '''(chunk, row) of transition i'''
+        if not 0 <= i < len(self):
+            raise IndexError(f'Transition {i} out of range')
+        chunk = int(np.searchsorted(self.offsets, i, side='right')) - 1
+        return chunk, i - int(self.offsets[chunk])
+
+    def __getitem__(self, i):
+        '''Transition i as {field: zero-copy view}'''
+        chunk, row = self.locate(i)
+        return {name: self.chunks[name][chunk][row] for name in self.fields}
+
+    def get_batch(self, indices):
+        '''The transitions at indices as {field: array}, copied per chunk'''
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) and not (
+                0 <= indices.min() and indices.max() < len(self)):
+            raise IndexError('Transition index out of range')
+        chunks = np.searchsorted(self.offsets, indices, side='right') - 1
+        rows = indices - self.offsets[chunks]
+
+        out = {}
+        for name in self.fields:
+            first = self.chunks[name][0]
+            out[name] = np.empty((len(indices),) + first.shape[1:],
+                                 dtype=first.dtype)
+        for chunk in np.unique(chunks):
+            sel = chunks == chunk
+            for name in self.fields:
+                out[name][sel] = self.chunks[name][chunk][rows[sel]]
+        return out
+
+    def iter_chunks(self):
+        '''{field: zero-copy array} per chunk, in order'''
+        for chunk in range(len(self.counts)):
+            yield {name: self.chunks[name][chunk] for name in self.fields}
+
+
+def export(path, games, ticks, width=None, length=None, policy='field',
+           chunk_size=2 ** 16, seed=None):
+    '''
+    Play games headless games in lockstep (`batch.BatchSnakeEnv`) for ticks
+    moves, writing every transition; returns the number written
+
+    The policy is 'field' (steering by `field.BatchFields`) or 'random'.
+    '''
+    import field
+
+    log = logging.getLogger('dataset')
+    env = batch.BatchSnakeEnv(games, width, length, seed=seed)
+    writer = Writer(path, env.width, env.length, chunk_size,
+                    meta=dict(source='batch', policy=policy, seed=seed,
+                              stride=games))
+    fields = field.BatchFields(env) if policy == 'field' else None
+    rng = np.random.default_rng(seed)
+
+    start = time.perf_counter()
+    for tick in range(ticks):
+        heads = env.head_cells()
+        directions = env.directions.copy()
+        deactiv = env.deactiv.copy()
+        grids = env.grids.copy()
+        if fields is not None:
+            actions = fields.actions()
+        else:
+            actions = rng.integers(0, len(batch.ACTIONS), games)
+        food = np.stack([env.food % env.width, env.food // env.width], 1)
+        # Games with a full board have no food
+        food[env._cells[env._rows, env.food] != batch.FOOD] = -1
+
+        rewards, dones, _ = env.step(actions)
+        if fields is not None:
+            fields.step(dones)
+
+        writer.extend(
+            grid=grids,
+            head=np.stack([heads % env.width, heads // env.width], 1),
+            food=food,
+            direction=directions,
+            # Turning back onto the neck keeps the snake going forward
+            action=np.where(actions == deactiv, directions, actions),
+            reward=rewards,
+            done=dones,
+        )
+        if (tick + 1) % 1000 == 0:
+            log.info(f'{writer.total:,} transitions written')
+    writer.close()
+
+    seconds = time.perf_counter() - start
+    log.info(f'Wrote {writer.total:,} transitions in {seconds:.1f}s '
+             f'({writer.total / seconds:,.0f}/s) to {path}')
+    return writer.total
+
+
+def info(path):
+    log = logging.getLogger('dataset')
+    data = Dataset(path)
+    rewards = np.zeros(3, dtype=np.int64)
+    nbytes = 0
+    for chunk in data.iter_chunks():
+        rewards += np.bincount(chunk['reward'].astype(np.int64) + 1,
+                               minlength=3)
+        nbytes += sum(a.nbytes for a in chunk.values())
+    log.info(f'{len(data):,} transitions of {data.width}x{data.length} '
+             f'games in {len(data.counts)} chunks '
+             f'({nbytes / 2 ** 20:,.1f}MiB), '
+             f'{len(data.episodes):,} episodes, {rewards[2]:,} food eaten, '
+             f'{rewards[0]:,} deaths; meta {data.meta}')
+    return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-dataset')
+    parser.add_argument('command', choices=['export', 'info'])
+    parser.add_argument('path')
+    parser.add_argument('--games', type=int, default=1024,
+                        help='games played in lockstep (export)')
+    parser.add_argument('--ticks', type=int, default=1000,
+                        help='moves of every game (export)')
+    parser.add_argument('--width', type=int, default=None)
+    parser.add_argument('--length', type=int, default=None)
+    parser.add_argument('--policy', choices=['field', 'random'],
+                        default='field')
+    parser.add_argument('--chunk_size', type=int, default=2 ** 16,
+                        help='transitions per chunk')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--debugging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    log_lvl = logging.DEBUG if args.debugging else logging.INFO
+    log_fmt = '[%(asctime)s] %(name)s %(levelname)s> %(message)s'
+    logging.basicConfig(format=log_fmt, level=log_lvl)
+
+    if args.command == 'export':
+        export(args.path, args.games, args.ticks, args.width, args.length,
+               args.policy, args.chunk_size, args.seed)
+    else:
+        info(args.path)
@@ -0,0 +1,201 @@
+'''
+Headless snake simulation
+
+The rules of `game.Game` / `player.Player` without pygame, a display or a
+clock, so games can be simulated as fast as the CPU allows. As there, the
+body and food are flat integer cells (see cells.py).
+'''
+import collections
+import random
+
+import cells as cells_mod
+import config
+import snake
+
+
+DELTAS = {
+    'up': (0, -1),
+    'down': (0, 1),
+    'left': (-1, 0),
+    'right': (1, 0),
+}
+
+OPPOSITES = {
+    'up': 'down',
+    'down': 'up',
+    'left': 'right',
+    'right': 'left',
+}
+
+ACTIONS = tuple(DELTAS.keys())
+
+State = collections.namedtuple('State', ['body', 'food', 'direction'])
+
+
+def get_direction(a, b):
+    '''Map the move from point a to b to a direction (e.g. 'up')'''
+    delta = (b[0] - a[0], b[1] - a[1])
+    for direction, d in DELTAS.items():
+        if d == delta:
+            return direction
+    raise ValueError(f'Points {a} and {b} are not adjacent')
+
+
+class SnakeEnv(object):
+    '''
+    A single game of snake on a width x length grid
+
+    Actions are directions ('up', 'down', 'left', 'right') or None to keep
+    moving in the current direction. As with `player.Player.move`, turning
+    back onto the snake's neck is ignored and the snake continues forward.
+    A snake moving off the board lands on the wall cell (`cells.wall`).
+    '''
+    def __init__(self, width=None, length=None,
+                 starting_pos=config.starting_pos):
+        self.width = width or config.board_size // config.space_dim[0]
+        self.length = length or config.board_size // config.space_dim[1]
+        self.starting_pos = list(starting_pos)     # Positions, as in config
+        self.cells = cells_mod.get_cells(self.width, self.length)
+
+        self.rng = None
+        self.snake = None
+        self.free = None        # Cells not occupied by the snake
+        self.food = None
+        self.direction = None
+        self.deactiv_direction = None
+        self.mv_cnt = 0
+        self.stall_cnt = 0      # Moves since food was last eaten
+        self.done = True
+        self.cause = None
+
+    def reset(self, seed=None):
+        '''Start a new game, seeding the food placement with seed'''
+        self.rng = random.Random(seed)
+        self.snake = snake.Snake(
+            [self.cells.cell(pos) for pos in self.starting_pos],
+            size=self.cells.size + 1,
+        )
+        self.reset_free()
+        self.food = None
+
+        # Like AIPlayer, start moving in the direction the body points
+        body = self.snake.pos
+        self.direction = self.cells.direction(body[1], body[0]) \
+            if len(body) > 1 else None
+        self.deactiv_direction = None
+
+        self.mv_cnt = 0
+        self.stall_cnt = 0
+        self.done = False
+        self.cause = None
+
+        self.reset_food()
+        return self.state()
+
+    def state(self):
+        '''Snapshot of the game state'''
+        return State(tuple(self.snake.pos), self.food, self.direction)
+
+    def head(self):
+        return self.snake.head()
+
+    def get_score(self):
+        return self.snake.pos.get_capacity() * 100
+
+    def is_inside(self, pos):
+        '''Check if the position pos is on the board'''
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.length
+
+    def reset_free(self):
+        '''Rebuild the free cells from the snake's body'''
+        self.free = cells_mod.FreeCells(self.width, self.length)
+        for cell in self.snake.pos:
+            self.free.remove(cell)
+
+    def reset_food(self):
+        '''Place food on a random free space (see `Game.reset_food`)'''
+        if len(self.free) == 0:
+            self.food = None
+            return None
+        self.food = self.free.choice(self.rng)
+        return self.food
+
+    def step(self, action=None):
+        '''
+        Advance the game by one move
+
+        Returns (reward, done, info) where reward is 1 for eating food, -1 for
+        dying and 0 otherwise, and info holds the score, move count and the
+        cause of death ('wall', 'ate itself') or 'board full' once the snake
+        covers the board.
+        '''
+        if self.done:
+            raise RuntimeError('Game is over, call reset() first')
+
+        self.mv_cnt += 1
+        self.stall_cnt += 1
+        if action is not None:
+            self.direction = action
+
+        reward = 0
+        if self.direction is not None:
+            if self.direction == self.deactiv_direction:
+                self.direction = OPPOSITES[self.deactiv_direction]
+
+            nxt = self.cells.step(self.head(), self.direction)
+
+            if nxt == self.food:
+                self.snake.grow(1)
+                self.stall_cnt = 0
+                reward = 1
+
+            tail = self.snake.add(nxt)
+            if nxt != self.cells.wall:
+                self.free.remove(nxt)
+            if tail is not None and tail not in self.snake.pos:
+                self.free.add(tail)
+            self.deactiv_direction = OPPOSITES[self.direction]
+
+            if nxt == self.cells.wall:
+                self._end('wall')
+                reward = -1
+            elif self.snake.pos.has_duplicates():
+                self._end('ate itself')
+                reward = -1
+            elif reward and self.reset_food() is None:
+                self._end('board full')
+
+        return reward, self.done, self.info()
+
+    def info(self):
+        return dict(
+            score=self.get_score(),
+            mv_cnt=self.mv_cnt,
+            cause=self.cause,
+        )
+
+    def _end(self, cause):
+        self.done = True
+        self.cause = cause
+
+    def play(self, policy, seed=None, max_moves=None, max_stall=None):
+        '''
+        Play a full game, calling policy(env) for the action of each move
+
+        Returns the final info dict. A game that reaches max_moves ends with
+        cause 'max moves', one that goes max_stall moves without eating (e.g.
+        an AI circling its tail) with cause 'stalled'.
+        '''
+        self.reset(seed)
+        info = self.info()
+        while not self.done:
+            if max_moves is not None and self.mv_cnt >= max_moves:
+                self._end('max moves')
+                info = self.info()
+                break
+            if max_stall is not None and self.stall_cnt >= max_stall:
+                self._end('stalled')
+                info = self.info()
+                break
+            _, _, info = self.step(policy(self))
+        return info
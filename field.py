@@ -0,0 +1,244 @@
+'''
+Distance fields: moves from every cell to the nearest target
+
+A `DistanceField` holds, for each cell of a board, the length of the shortest
+path to the nearest of a set of targets (e.g. all the food) around blocked
+cells (snake bodies). It's computed once with a vectorized NumPy wavefront
+over the neighbor table (see cells.py), then repaired incrementally as cells
+are blocked or freed and targets come and go, touching only the cells whose
+distance changes. Any number of snakes on the board can steer by it: greedy
+descent (`descend`) is an O(1) look at the head's neighbors.
+
+`BatchFields` keeps one field per game of a `batch.BatchSnakeEnv` in a single
+array, following the games' moves and choosing every game's action at once.
+'''
+import collections
+
+import numpy as np
+
+import batch
+import cells as cells_mod
+
+
+INF = 2 ** 30   # Distance of unreachable and blocked cells
+
+
+class DistanceField(object):
+    '''
+    Distances to the nearest target on a width x length board
+
+    dist may be a row of a larger (k, width * length + 1) int32 array, to
+    keep several fields together (see `BatchFields`).
+    '''
+    def __init__(self, width, length, dist=None):
+        self.width = width
+        self.length = length
+        self.cells = cells_mod.get_cells(width, length)
+
+        self.dist = np.full(self.cells.size + 1, INF, dtype=np.int32) \
+            if dist is None else dist
+        self._dist = memoryview(self.dist)  # Fast scalar access
+        self.blocked = self.cells.mask(())
+        self.targets = set()
+
+    def reset(self, targets, blocked):
+        '''Recompute from positions of targets and a blocked container'''
+        self.blocked = self.cells.mask(blocked)
+        self.targets = {self.cells.cell(pos) for pos in targets}
+        self.targets.discard(self.cells.wall)
+        self.compute()
+
+    def compute(self):
+        '''Recompute every distance with a wavefront from the targets'''
+        table = self.cells.table
+        dist = self.dist
+        dist[:] = INF
+
+        frontier = np.array(sorted(self.targets), dtype=np.int32)
+        open_cells = np.frombuffer(self.blocked, dtype=np.uint8) == 0
+        frontier = frontier[open_cells[frontier]]
+        open_cells[frontier] = False
+        d = 0
+        while len(frontier):
+            dist[frontier] = d
+            d += 1
+            nbrs = table[frontier].ravel()
+            frontier = np.unique(nbrs[open_cells[nbrs]])
+            open_cells[frontier] = False
+
+    def distance(self, pos):
+        '''Moves from pos to the nearest target (INF if unreachable)'''
+        return self._dist[self.cells.cell(pos)]
+
+    def descend(self, pos):
+        '''The free neighbor of pos nearest to a target, or None'''
+        dist = self._dist
+        best, best_dist = None, INF
+        for nb in self.cells.neighbors[self.cells.cell(pos)]:
+            if dist[nb] < best_dist:
+                best, best_dist = nb, dist[nb]
+        return None if best is None else self.cells.positions[best]
+
+    def block(self, pos):
+        '''The cell at pos became blocked'''
+        cell = self.cells.cell(pos)
+        if self.blocked[cell]:
+            return
+        self.blocked[cell] = 1
+        self._dist[cell] = INF
+        self._raise(self.cells.neighbors[cell])
+
+    def free(self, pos):
+        '''The cell at pos became free'''
+        cell = self.cells.cell(pos)
+        if not self.blocked[cell]:
+            return
+        self.blocked[cell] = 0
+        self._reconnect([cell])
+
+    def add_target(self, pos):
+        cell = self.cells.cell(pos)
+        if cell == self.cells.wall or cell in self.targets:
+            return
+        self.targets.add(cell)
+        if not self.blocked[cell]:
+            self._dist[cell] = 0
+            self._lower([cell])
+
+    def remove_target(self, pos):
+        cell = self.cells.cell(pos)
+        if cell not in self.targets:
+            return
+        self.targets.remove(cell)
+        if not self.blocked[cell]:
+            self._raise([cell])
+
+    def _lower(self, seeds):
+        '''Spread the (lowered) distances of seeds to their neighbors'''
+        dist, blocked = self._dist, self.blocked
+        neighbors = self.cells.neighbors
+        queue = collections.deque(seeds)
+        while queue:
+            cell = queue.popleft()
+            d = dist[cell] + 1
+            for nb in neighbors[cell]:
+                if d < dist[nb] and not blocked[nb]:
+                    dist[nb] = d
+                    queue.append(nb)
+
+    def _reconnect(self, cells):
+        '''Set cells from their neighbors' distances, spread any decrease'''
+        dist, blocked = self._dist, self.blocked
+        neighbors, targets = self.cells.neighbors, self.targets
+        seeds = []
+        for cell in cells:
+            if blocked[cell]:
+                continue
+            d = INF
+            if cell in targets:
+                d = 0
+            else:
+                for nb in neighbors[cell]:
+                    if dist[nb] < d:
+                        d = dist[nb]
+                d += 1
+            if d < dist[cell]:
+                dist[cell] = d
+                seeds.append(cell)
+        self._lower(seeds)
+
+    def _raise(self, cells):
+        '''
+        Repair distances that may have run through a now blocked cell (or a
+        removed target) next to cells
+
+        Cells left without a neighbor one move closer to a target lose their
+        distance, as do their neighbors in turn; the orphaned cells are then
+        reconnected from the cells around them.
+        '''
+        dist, blocked = self._dist, self.blocked
+        neighbors, targets = self.cells.neighbors, self.targets
+        orphans = []
+        queue = collections.deque(cells)
+        while queue:
+            cell = queue.popleft()
+            d = dist[cell]
+            if d == INF or blocked[cell] or cell in targets:
+                continue
+            d -= 1
+            for nb in neighbors[cell]:
+                if dist[nb] == d:
+                    break   # Still one move from a closer cell
+            else:
+                dist[cell] = INF
+                orphans.append(cell)
+                queue.extend(neighbors[cell])
+        self._reconnect(orphans)
+
+
+class BatchFields(object):
+    '''
+    Distance fields to the food of each game in a `batch.BatchSnakeEnv`
+
+    Call `step` with the env's step results to follow the games; finished
+    games (which the env has reset) are recomputed, the rest repaired.
+    '''
+    def __init__(self, env):
+        self.env = env
+        self.dist = np.full((env.n, env.size + 1), INF, dtype=np.int32)
+        self.fields = [DistanceField(env.width, env.length, row)
+                       for row in self.dist]
+        self._table = self.fields[0].cells.table[:-1]
+        # Columns of the neighbor table in terms of batch.ACTIONS
+        self._actions = np.array([batch.ACTIONS.index(a)
+                                  for a in ('left', 'right', 'up', 'down')],
+                                 dtype=np.int8)
+        self._tails = None
+        self._food = None
+        self.reset()
+
+    def _tail_cells(self):
+        env = self.env
+        return env.bodies[env._rows, (env.heads - env.lengths + 1) % env.size]
+
+    def reset(self, idx=None):
+        '''Recompute the fields of games idx (default: all) from the env'''
+        env = self.env
+        idx = range(env.n) if idx is None else idx
+        for i in idx:
+            blocked = env._cells[i] != batch.EMPTY
+            blocked[env.food[i]] = False
+            field = self.fields[i]
+            field.blocked = field.cells.mask_from_array(blocked)
+            field.targets = {int(env.food[i])}
+            field.compute()
+        self._tails = self._tail_cells()
+        self._food = env.food.copy()
+
+    def step(self, dones):
+        '''Follow the games through the env's last step'''
+        env = self.env
+        heads = env.head_cells()
+        tails = self._tail_cells()
+        positions = self.fields[0].cells.positions
+        for i in np.flatnonzero(~dones):
+            field = self.fields[i]
+            if self._food[i] != env.food[i]:
+                field.remove_target(positions[self._food[i]])
+            # Free the old tail first: the head may have moved onto it
+            if self._tails[i] != tails[i]:
+                field.free(positions[self._tails[i]])
+            field.block(positions[heads[i]])
+            if self._food[i] != env.food[i]:
+                field.add_target(positions[env.food[i]])
+        self._tails = tails
+        self._food = env.food.copy()
+        if dones.any():
+            self.reset(np.flatnonzero(dones))
+
+    def actions(self):
+        '''Every game's action (an index into batch.ACTIONS) by descent'''
+        heads = self.env.head_cells()
+        nbrs = self._table[heads]
+        nb_dist = np.take_along_axis(self.dist, nbrs, axis=1)
+        return self._actions[np.argmin(nb_dist, axis=1)]
@@ -2,36 +2,58 @@ import argparse
 import logging
 import pygame
 import random
+import time
 
 import config
 import board
+import dataset
+import engine
+import glyphs
+import planner
 import player
+import profiler
+import render
+import replay
 
 
 class Text(object):
     def __init__(self, text, position, **kwargs):
-        font_name = kwargs.get('font', 'freesansbold.ttf')
-        font_size = kwargs.get('size', 32)
-        self.font = pygame.font.Font(font_name, font_size)
+        self.font_name = kwargs.get('font', 'freesansbold.ttf')
+        self.font_size = kwargs.get('size', 32)
+        self.font = glyphs.get_font(self.font_name, self.font_size)
 
         self.text = text
         self.position = position
 
         self.text_color = kwargs.get('text_color', config.blue)
         self.background = kwargs.get('background', config.white)
+        # Attribute of the text's rect placed at position (e.g. 'topleft')
+        self.anchor = kwargs.get('anchor', 'center')
 
     def draw(self, screen):
-        text_surface = \
-            self.font.render(self.text, True, self.text_color, self.background)
+        text_surface = glyphs.render(
+            self.text, self.font_name, self.font_size,
+            self.text_color, self.background
+        )
 
         surface_rect = text_surface.get_rect()
-        surface_rect.center = self.position
+        setattr(surface_rect, self.anchor, self.position)
 
         screen.blit(text_surface, surface_rect)
+        return surface_rect
+
+
+class NumberText(Text):
+    '''Text of digits, composed from a cached digit atlas'''
+    def draw(self, screen):
+        atlas = glyphs.get_digit_atlas(
+            self.font_name, self.font_size, self.text_color, self.background
+        )
+        return atlas.draw(screen, self.text, self.position)
 
 
 def get_score_text(score, **kwargs):
-    return Text(str(score), (config.board_size // 2, 20), **kwargs)
+    return NumberText(str(score), (config.board_size // 2, 20), **kwargs)
 
 
 def get_gameover_text(text):
@@ -40,6 +62,20 @@ def get_gameover_text(text):
     return Text(text, position, text_color=config.red)
 
 
+def get_turbo_text(turbo):
+    label = 'Turbo: uncapped' if turbo == 0 else f'Turbo: x{turbo}'
+    return Text(label, (config.board_size - 10, 10), size=16,
+                text_color=config.black, anchor='topright')
+
+
+def get_profiler_texts(lines):
+    return [
+        Text(line, (10, 10 + 18 * i), size=16,
+             text_color=config.black, anchor='topleft')
+        for i, line in enumerate(lines)
+    ]
+
+
 def draw_path(path, board, screen):
     if path is None or len(path) <= 1:
         return
@@ -50,70 +86,236 @@ def draw_path(path, board, screen):
 
 
 class Game(object):
-    def __init__(self, screen, ai_player=False):
+    def __init__(self, screen, ai_player=False, planner='astar',
+                 profile_out=None, seed=None, record_dir=None,
+                 async_planning=True, food_count=1, turbo=1, export_dir=None):
         self.clock = pygame.time.Clock()
 
         self.screen = screen
         self.running = False
+        self.quit = False       # The window was closed
         self.ai_player = ai_player
+        self.planner = planner
+        self.async_planning = async_planning
 
         self.board = None
+        self.renderer = None
         self.player = None
-        self.food = None
+        self.food = None        # The last food placed
+        self.food_count = food_count    # Food items on the board at once
         self.speed = None
         self.gameover = None
+        # Speed multiplier (0 for as fast as possible), cycled with 't'
+        self.turbo = turbo
+
+        # Frame timing, shown with the 'o' key and written to profile_out
+        self.profiler = profiler.FrameProfiler()
+        self.profile_out = profile_out
+        self.show_profile = False
+        self._profile_lines = []
+        self._profile_time = 0      # When the lines were last refreshed
+
+        # Each game's food placement is seeded from rng, so a seeded session
+        # replays the same way; games are saved to record_dir if set
+        self.rng = random.Random(seed)
+        self.food_rng = None
+        self.record_dir = record_dir
+        self.recorder = None
+
+        # Training data (see dataset.py), written to export_dir if set
+        self.export_dir = export_dir
+        self.exporter = None
 
         self.log = logging.getLogger(self.__class__.__name__)
+        if record_dir is not None and food_count > 1:
+            # Replays (engine.SnakeEnv) have a single food at a time
+            self.log.warning('Not recording games with more than one food')
+            self.record_dir = None
+
+    def new_recorder(self, seed):
+        return replay.Recorder(
+            self.board.width, self.board.length, config.starting_pos, seed,
+            meta=dict(
+                board_size=config.board_size,
+                space_dim=list(config.space_dim),
+                planner=self.planner if self.ai_player else None,
+            ),
+        )
 
     def start(self):
-        # Start Loop
-        while self._prompt_newgame():
-            self.log.info('Starting new game')
-
-            self.board = board.Board(config.board_size)
-
-            if self.ai_player:
-                self.player = player.AIPlayer(self.board)
-            else:
-                self.player = player.HumanPlayer(self.board)
+        '''Play games until the player declines or closes the window'''
+        try:
+            while self._prompt_newgame():
+                self._play()
+        finally:
+            self._close()
+
+    def _play(self):
+        self.log.info('Starting new game')
+
+        self.board = board.Board(config.board_size)
+
+        if self.ai_player and self.planner == 'search':
+            self.player = player.SearchPlayer(self.board)
+            self.player.profiler = self.profiler
+        elif self.ai_player:
+            self.player = player.AIPlayer(
+                self.board, planner=self.planner,
+                worker=self.async_planning
+            )
+            self.player.profiler = self.profiler
+        else:
+            self.player = player.HumanPlayer(self.board)
 
-            self.gameover = False
-            self.speed = config.speed
-            self.reset_food()
+        game_seed = self.rng.randrange(2 ** 32)
+        self.food_rng = random.Random(game_seed)
+        self.recorder = self.new_recorder(game_seed) \
+            if self.record_dir is not None else None
 
+        self.gameover = False
+        self.speed = config.speed
+        self.food = None
+        self.reset_food()
+        self.renderer = render.Renderer(self.screen, self.board)
+        if self.export_dir is not None and self.exporter is None:
+            self.exporter = dataset.Writer(
+                self.export_dir, self.board.width, self.board.length,
+                meta=dict(source='game', planner=self.planner
+                          if self.ai_player else None),
+            )
+
+        try:
             self._loop()
+        finally:
+            self.player.stop()
+        if self.exporter is not None:
+            self.exporter.end_episode()
+
+        if self.recorder is not None:
+            path = self.recorder.save(self.record_dir)
+            self.log.info(f'Saved replay to {path}')
+
+    def _close(self):
+        '''Flush the training data and frame profile, however the games end'''
+        if self.exporter is not None:
+            self.log.info(f'Wrote {len(self.exporter)} transitions to '
+                          f'{self.export_dir}')
+            self.exporter.close()
+
+        if self.profile_out is not None:
+            self.log.info(f'Writing frame profile to {self.profile_out}')
+            self.profiler.dump(self.profile_out)
 
     def _loop(self):
-
+        '''
+        Simulate self.speed moves per second, drawing at config.fps
+
+        Input is handled and the board drawn every frame, independent of the
+        moves, so the window stays responsive. After a stall (e.g. a pause),
+        at most config.max_catchup moves are simulated in a frame.
+
+        In turbo mode moves are simulated self.turbo times as fast, or for
+        the whole of each frame when uncapped (0), and the board is only
+        drawn config.turbo_fps times a second.
+        '''
+        prof = self.profiler
+        lag = 0.0
+        last = last_draw = time.perf_counter()
         self.running = True
         while self.running:
+            frame_start = t = prof.start()
+            elapsed, last = frame_start - last, frame_start
+
             self.log.debug('Loop: Checking key events')
             self._key_events()
-            self.log.debug('Loop: Moving objects')
-            self._move()
-            self.log.debug('Loop: Checking game events')
-            self._game_events()
+            t = prof.lap('input', t)
 
+            if self.turbo == 0:
+                deadline = frame_start + 1 / config.fps
+                while self.running and time.perf_counter() < deadline:
+                    self._tick()
+            else:
+                step = 1 / (self.speed * self.turbo)
+                lag = min(lag + elapsed,
+                          max(config.max_catchup * step, 2 / config.fps))
+                while lag >= step and self.running:
+                    lag -= step
+                    self._tick()
             if self.gameover:
                 self.log.info('Game Over')
-                continue
-
-            self.log.debug('Loop: Drawing objects')
-            self._draw()
+                break
 
-            pygame.display.update()
-            self.clock.tick(config.speed)
+            draw_every = 1 / config.turbo_fps if self.turbo != 1 else 0
+            if frame_start - last_draw >= draw_every:
+                last_draw = frame_start
+                t = prof.start()
+                self.log.debug('Loop: Drawing objects')
+                rects = self._draw()
+                t = prof.lap('draw', t)
+                pygame.display.update(rects)
+                t = prof.lap('display', t)
+            t = prof.start()
+            prof.record('frame', t - frame_start)
+            if self.turbo != 0:
+                self.clock.tick(config.fps)
+            prof.lap('tick', t)
 
         pygame.display.update()
         self.clock.tick(config.speed)
 
+    def _tick(self):
+        '''Advance the game by one move'''
+        t = self.profiler.start()
+        if self.exporter is not None:
+            head, score = self._observe()
+        if self.ai_player:
+            # In turbo the worker can't keep up with the moves: wait for it
+            self.player.react_to(wait=self.turbo != 1)
+        self.log.debug('Loop: Moving objects')
+        self._move()
+        t = self.profiler.lap('move', t)
+        self.log.debug('Loop: Checking game events')
+        self._game_events()
+        self.profiler.lap('events', t)
+        if self.exporter is not None:
+            self._export_move(head, score)
+
+    def _observe(self):
+        '''Export the observation before a move, return the head and score'''
+        cells = self.board.cells
+        body = self.player.pos
+        head = body.first()
+        direction = engine.ACTIONS.index(cells.direction(body[1], head)) \
+            if len(body) > 1 else -1
+        food = self.board.foods.nearest(head)
+        self.exporter.observe(
+            self.board.grid, cells.position(head),
+            None if food is None else cells.position(food), direction,
+        )
+        return head, self.player.get_score()
+
+    def _export_move(self, head, score):
+        moved_to = self.player.head()
+        action = -1 if moved_to == head else \
+            engine.ACTIONS.index(self.player.direction)
+        reward = 1 if self.player.get_score() > score else \
+            -1 if self.gameover else 0
+        self.exporter.act(action, reward, self.gameover)
+
     def _key_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
+                self.log.info('Quitting')
+                self.running = False
+                self.quit = True
+                break
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                 self.log.info('Pausing game')
                 self.running = pause()
+                if not self.running:
+                    self.log.info('Quitting')
+                    self.quit = True
+                    break
                 self.log.info('Resuming game')
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_i:
                 import pdb; pdb.set_trace()
@@ -121,15 +323,20 @@ class Game(object):
                 self.log.info('Restarting game')
                 self.running = False
                 break
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_o:
+                self.show_profile = not self.show_profile
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_t:
+                self.toggle_turbo()
 
             if not self.ai_player:
                 self.player.react_to(event=event)
 
-        if self.ai_player:
-            self.player.react_to()
-
     def _move(self):
+        head = self.player.head()
         self.player.move()
+        moved_to = self.player.head()
+        if self.recorder is not None and moved_to != head:
+            self.recorder.record_move(self.player.direction)
 
     def _game_events(self):
         # Check for gameover events
@@ -148,23 +355,43 @@ class Game(object):
         self.speed = self.get_speed(self.player.get_score())
 
         # Reset Food
-        if not self.is_food_set():
+        if not self.board.foods and self.board.count(board.EMPTY) == 0:
+            get_gameover_text('Snake filled the board!').draw(self.screen)
+            self.running = False
+            self.gameover = True
+            return
+        elif not self.is_food_set():
             self.log.debug('Food not set, resetting food')
+            t = self.profiler.start()
             self.reset_food()
+            self.profiler.lap('reset_food', t)
         else:
             self.log.debug('Food still set')
 
     def _draw(self):
-        self.board.draw(self.screen)
-        self.player.draw(self.screen)
-
+        '''Draw the changes since the last frame, return the dirty rects'''
+        path = None
         if isinstance(self.player, player.AIPlayer):
-            draw_path(self.player.path, self.board, self.screen)
+            path = self.player.path
+
+        texts = [get_score_text(self.player.get_score())]
+        if self.turbo != 1:
+            texts.append(get_turbo_text(self.turbo))
 
-        get_score_text(self.player.get_score()).draw(self.screen)
+        if self.show_profile:
+            # Refresh the numbers a few times a second, not every frame
+            now = time.perf_counter()
+            if now - self._profile_time >= config.profile_refresh:
+                self._profile_lines = self.profiler.lines()
+                self._profile_time = now
+            texts.extend(get_profiler_texts(self._profile_lines))
+
+        return self.renderer.draw(path, texts)
 
     def _prompt_newgame(self):
         self.log.debug('Prompt newgame')
+        if self.quit:
+            return False
         position = (config.board_size // 2, config.board_size // 3)
         Text('Start a New Game? [Y/N]', position).draw(self.screen)
         pygame.display.update()
@@ -173,26 +400,34 @@ class Game(object):
         while True:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
+                    self.quit = True
+                    return False
                 elif event.type == pygame.KEYDOWN and event.key == pygame.K_y:
                     return True
                 elif event.type == pygame.KEYDOWN and event.key == pygame.K_n:
                     return False
 
+    def toggle_turbo(self):
+        '''Switch to the next of config.turbo_levels'''
+        levels = config.turbo_levels
+        i = levels.index(self.turbo) if self.turbo in levels else -1
+        self.turbo = levels[(i + 1) % len(levels)]
+        self.log.info('Turbo off' if self.turbo == 1 else
+                      'Turbo uncapped' if self.turbo == 0 else
+                      f'Turbo x{self.turbo}')
+
     def is_food_set(self):
-        return self.food not in self.player.get_spaces()
+        '''Check if all food_count food items are on the board'''
+        return len(self.board.foods) >= self.food_count
 
     def reset_food(self):
-        if self.food is not None:
-            self.food.color = config.background_color
-
-        spaces = [
-            s for s in self.board
-            if s not in self.player.get_spaces()
-        ]
-        randint = random.randint(0, len(spaces) - 1)
-        self.food = spaces[randint]
-        self.food.color = config.food_color
+        '''Top the board up to food_count foods, on random empty cells'''
+        free = self.board.free
+        while not self.is_food_set() and len(free) > 0:
+            self.food = self.board[free.choice(self.food_rng)]
+            self.board.foods.add(self.food.cell)
+            if self.recorder is not None:
+                self.recorder.record_food(self.food.cell)
 
     def get_speed(self, score):
         score_speed_map = {
@@ -225,12 +460,15 @@ def pause():
                 return True
 
 
-def main(ai_player=False):
+def main(ai_player=False, planner='astar', profile_out=None, seed=None,
+         record_dir=None, async_planning=True, food_count=1, turbo=1,
+         export_dir=None):
     pygame.init()
     screen = pygame.display.set_mode((config.board_size, config.board_size))
     pygame.display.set_caption('PySnake')
 
-    g = Game(screen, ai_player)
+    g = Game(screen, ai_player, planner, profile_out, seed, record_dir,
+             async_planning, food_count, turbo, export_dir)
     g.start()
 
     pygame.quit()
@@ -240,10 +478,31 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser('py-snake')
     parser.add_argument('--debugging', action='store_true', default=False)
     parser.add_argument('--ai_player', action='store_true', default=False)
+    parser.add_argument('--planner', default='astar',
+                        choices=list(planner.PLANNERS) + ['search'],
+                        help="'search' plays by lookahead search (search.py)")
+    parser.add_argument('--profile_out', default=None,
+                        help='write frame timings (JSON) here on exit')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed the food placement')
+    parser.add_argument('--record', default=None, metavar='DIR',
+                        help='save a replay of each game in DIR')
+    parser.add_argument('--sync_planning', action='store_true', default=False,
+                        help='plan AI paths on the frame thread')
+    parser.add_argument('--food', type=int, default=1,
+                        help='food items on the board at once')
+    parser.add_argument('--turbo', type=int, default=1,
+                        choices=config.turbo_levels,
+                        help="start at this speed multiple, 0 for uncapped "
+                             "('t' cycles config.turbo_levels)")
+    parser.add_argument('--export', default=None, metavar='DIR',
+                        help='write training data (see dataset.py) to DIR')
     # parser.add_argument('--')
     args = parser.parse_args()
 
     log_lvl = logging.DEBUG if args.debugging else logging.INFO
     log_fmt = '[%(asctime)s] %(name)s %(levelname)s> %(message)s'
     logging.basicConfig(format=log_fmt, level=log_lvl)
-    main(args.ai_player)
+    main(args.ai_player, args.planner, args.profile_out, args.seed,
+         args.record, not args.sync_planning, args.food, args.turbo,
+         args.export)
@@ -0,0 +1,98 @@
+'''
+Caches for fonts and rendered text
+
+Loading a font reads the font file and rendering text rasterizes it, so both
+are cached: fonts per (name, size), rendered surfaces in a bounded LRU cache
+keyed by (font, size, colors, text), and digit glyphs in an atlas so changing
+numbers (the score) are composed from pre-rendered digits.
+'''
+import collections
+import functools
+
+import pygame
+
+
+@functools.lru_cache(maxsize=32)
+def get_font(name, size):
+    return pygame.font.Font(name, size)
+
+
+class SurfaceCache(object):
+    '''Least-recently-used cache of rendered text surfaces'''
+    def __init__(self, capacity=256):
+        if capacity <= 0:
+            raise ValueError(f'Expected capacity to be >= 1, got: {capacity}')
+        self.capacity = capacity
+        self._surfaces = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def render(self, text, font_name, size, text_color, background=None):
+        key = (font_name, size, text_color, background, text)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            return surface
+
+        font = get_font(font_name, size)
+        surface = font.render(text, True, text_color, background)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.capacity:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+
+class DigitAtlas(object):
+    '''Pre-rendered digit glyphs for drawing numbers with a few blits'''
+    chars = '0123456789-'
+
+    def __init__(self, font_name, size, text_color, background=None):
+        font = get_font(font_name, size)
+        self.background = background
+        self.glyphs = {
+            c: font.render(c, True, text_color, background)
+            for c in self.chars
+        }
+        self.height = max(g.get_height() for g in self.glyphs.values())
+
+    def get_rect(self, text):
+        width = sum(self.glyphs[c].get_width() for c in text)
+        return pygame.Rect(0, 0, width, self.height)
+
+    def draw(self, screen, text, center):
+        '''Draw text (digits only) centered at center, return its rect'''
+        rect = self.get_rect(text)
+        rect.center = center
+        if self.background is not None:
+            screen.fill(self.background, rect)
+
+        x = rect.left
+        for c in text:
+            glyph = self.glyphs[c]
+            screen.blit(glyph, (x, rect.top))
+            x += glyph.get_width()
+        return rect
+
+
+@functools.lru_cache(maxsize=16)
+def get_digit_atlas(font_name, size, text_color, background=None):
+    return DigitAtlas(font_name, size, text_color, background)
+
+
+surface_cache = SurfaceCache()
+
+
+def render(text, font_name, size, text_color, background=None):
+    '''Render text through the shared surface cache'''
+    return surface_cache.render(text, font_name, size, text_color, background)
+
+
+def clear():
+    '''Drop all cached fonts and surfaces (e.g. after pygame.quit)'''
+    get_font.cache_clear()
+    get_digit_atlas.cache_clear()
+    surface_cache.clear()
@@ -0,0 +1,102 @@
+'''
+Hamiltonian cycles over the board
+
+A cycle visiting every cell exactly once lets the snake fill the board: a
+snake following it never runs into itself. Cycles are computed once per
+board size and cached on disk (config.cache_dir) as the index of each cell
+along the cycle.
+'''
+import functools
+import os
+
+import numpy as np
+
+import config
+
+
+def build_cycle(width, length):
+    '''
+    Board positions along a Hamiltonian cycle of a width x length board
+
+    Goes back and forth over columns 1+ from top to bottom, then back up
+    column 0. Needs an even number of rows (or columns, in which case the
+    board is traversed transposed); boards with an odd number of cells have
+    no Hamiltonian cycle.
+    '''
+    if length % 2 and width % 2 == 0:
+        return [(x, y) for y, x in build_cycle(length, width)]
+    if length % 2 or width < 2:
+        raise ValueError(f'No Hamiltonian cycle on a {width}x{length} board')
+
+    order = []
+    for y in range(length):
+        xs = range(1, width) if y % 2 == 0 else range(width - 1, 0, -1)
+        order.extend((x, y) for x in xs)
+    order.extend((0, y) for y in range(length - 1, -1, -1))
+    return order
+
+
+def get_cache_path(width, length):
+    return os.path.join(config.cache_dir, f'hamilton-{width}x{length}.npy')
+
+
+def load_index(width, length):
+    '''
+    The (length, width) array of each cell's index along the cycle
+
+    Read from the disk cache if present, otherwise built and cached.
+    '''
+    path = get_cache_path(width, length)
+    try:
+        index = np.load(path)
+        if index.shape == (length, width):
+            return index
+    except (OSError, ValueError):
+        pass
+
+    index = np.empty((length, width), dtype=np.int32)
+    for i, (x, y) in enumerate(build_cycle(width, length)):
+        index[y, x] = i
+
+    try:
+        os.makedirs(config.cache_dir, exist_ok=True)
+        np.save(path, index)
+    except OSError:
+        pass    # Caching is best effort
+    return index
+
+
+class Cycle(object):
+    '''
+    A board's Hamiltonian cycle, with O(1) index and successor lookups of
+    cells (y * width + x, see cells.py)
+    '''
+    def __init__(self, width, length):
+        self.width = width
+        self.length = length
+        self.size = width * length
+
+        index = load_index(width, length)
+        self._index = index.ravel().tolist()    # Lists index faster
+        self._order = [None] * self.size
+        for cell, i in enumerate(self._index):
+            self._order[i] = cell
+
+    def index(self, cell):
+        return self._index[cell]
+
+    def at(self, i):
+        '''The cell at index i (mod the cycle's length)'''
+        return self._order[i % self.size]
+
+    def next(self, cell):
+        return self.at(self._index[cell] + 1)
+
+    def distance(self, a, b):
+        '''Steps from a forward along the cycle to b'''
+        return (self._index[b] - self._index[a]) % self.size
+
+
+@functools.lru_cache(maxsize=8)
+def get_cycle(width, length):
+    return Cycle(width, length)
@@ -0,0 +1,198 @@
+'''
+Load test for the game server (server.py)
+
+Two modes:
+
+- step: every session is stepped by the client as fast as the server
+  replies, pipelined per connection. Reports moves per second and the
+  round-trip latency of a step.
+- tick: sessions are ticked by the server every --tick_ms and subscribed
+  to. Reports the diffs delivered against the target rate and how late the
+  server's ticks run.
+
+Both report sessions per core: how many sessions at --tick_ms one core of
+the server could run, from the server's CPU time over the test. Without
+--port or --unix a server is started on a temporary Unix socket.
+
+    python -m loadtest --mode tick --sessions 2000 --seconds 10
+'''
+import argparse
+import asyncio
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import server
+
+
+async def step_worker(client, sids, deadline, latencies, rng):
+    '''Step sids over one connection until deadline, return moves made'''
+    moves = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        for sid in sids:
+            action = rng.randrange(4) if rng.random() < 0.1 else server.KEEP
+            client.send(server.STEP, server.STEP_MSG.pack(sid, action))
+
+        done = []
+        for sid in sids:
+            _, payload = await client.read()
+            latencies.append(time.perf_counter() - start)
+            diff = server.DIFF_MSG.unpack(payload)
+            if server.EVENTS[diff[2]] not in (None, 'ate'):
+                done.append(sid)
+        moves += len(sids)
+
+        for sid in done:
+            client.send(server.RESET, server.RESET_MSG.pack(sid, -1))
+        for sid in done:
+            await client.read()
+    return moves
+
+
+async def tick_worker(client, sids, deadline, tick_ms):
+    '''Subscribe to sids (ticked by the server), return diffs received'''
+    for sid in sids:
+        client.send(server.SUBSCRIBE, server.SESSION_MSG.pack(sid))
+
+    diffs = 0
+    while True:
+        timeout = deadline - time.perf_counter()
+        if timeout <= 0:
+            return diffs
+        try:
+            kind, payload = await asyncio.wait_for(client.read(), timeout)
+        except asyncio.TimeoutError:
+            return diffs
+        if kind != server.DIFF:
+            continue    # A STATE resync, or a reply to a RESET
+        diffs += 1
+        diff = server.DIFF_MSG.unpack(payload)
+        if server.EVENTS[diff[2]] not in (None, 'ate'):
+            client.send(server.RESET, server.RESET_MSG.pack(diff[0], -1))
+
+
+async def run(mode, sessions, connections, seconds, tick_ms, width, length,
+              port=None, unix=None, seed=0):
+    log = logging.getLogger('loadtest')
+    rng = random.Random(seed)
+
+    clients = [await server.Client.connect(port=port, unix=unix)
+               for _ in range(connections)]
+    groups = [[] for _ in clients]
+    for i in range(sessions):
+        client = clients[i % connections]
+        sid = await client.new(width, length, seed=rng.randrange(2 ** 32),
+                               tick_ms=tick_ms if mode == 'tick' else 0)
+        groups[i % connections].append(sid)
+    log.info(f'Opened {sessions} sessions over {connections} connections')
+
+    stats_client = await server.Client.connect(port=port, unix=unix)
+    before = await stats_client.stats()
+    start = time.perf_counter()
+    deadline = start + seconds
+
+    latencies = []
+    if mode == 'step':
+        counts = await asyncio.gather(*(
+            step_worker(c, g, deadline, latencies, random.Random(seed + i))
+            for i, (c, g) in enumerate(zip(clients, groups))
+        ))
+    else:
+        counts = await asyncio.gather(*(
+            tick_worker(c, g, deadline, tick_ms)
+            for c, g in zip(clients, groups)
+        ))
+
+    elapsed = time.perf_counter() - start
+    after = await stats_client.stats()
+    for client in clients + [stats_client]:
+        await client.close()
+
+    moves = sum(counts)     # Moves made (step) or diffs received (tick)
+    ticks = after['ticks'] - before['ticks']
+    cpu_seconds = after['cpu_seconds'] - before['cpu_seconds']
+    cpu = cpu_seconds / (after['wall_seconds'] - before['wall_seconds'])
+    per_core = ticks / max(cpu_seconds, 1e-9) * tick_ms / 1000
+
+    result = dict(
+        mode=mode,
+        sessions=sessions,
+        moves_per_sec=moves / elapsed,
+        server_cpu=cpu,
+        sessions_per_core=per_core,
+    )
+    log.info(f'{moves / elapsed:,.0f} moves/s, server at {cpu:.0%} of a core '
+             f'-> {per_core:,.0f} sessions per core at {tick_ms}ms ticks')
+    if mode == 'step':
+        ms = np.array(latencies) * 1000
+        result.update(p50_ms=np.percentile(ms, 50),
+                      p99_ms=np.percentile(ms, 99))
+        log.info(f'Step round trip p50 {result["p50_ms"]:.2f}ms, '
+                 f'p99 {result["p99_ms"]:.2f}ms')
+    else:
+        target = sessions * 1000 / tick_ms
+        lateness = after['lateness_ms']
+        result.update(target_per_sec=target, ticks_per_sec=ticks / elapsed,
+                      lateness_ms=lateness)
+        log.info(f'Server ticked {ticks / elapsed / target:.0%} and delivered '
+                 f'{moves / elapsed / target:.0%} of the target '
+                 f'{target:,.0f} ticks/s; ticks late by p50 '
+                 f'{lateness["p50"]:.2f}ms, p99 {lateness["p99"]:.2f}ms')
+    return result
+
+
+def spawn_server(path):
+    '''Start a server on the Unix socket path, return the process'''
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'server', '--unix', path],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    for _ in range(100):
+        if os.path.exists(path):
+            return proc
+        time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError('Server didn\'t start')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-loadtest')
+    parser.add_argument('--mode', choices=['step', 'tick'], default='step')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=10)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--tick_ms', type=int, default=100,
+                        help='tick interval of the sessions (tick mode) and '
+                             'for sessions per core')
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--length', type=int, default=20)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--unix', default=None)
+    parser.add_argument('--debugging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    log_lvl = logging.DEBUG if args.debugging else logging.INFO
+    log_fmt = '[%(asctime)s] %(name)s %(levelname)s> %(message)s'
+    logging.basicConfig(format=log_fmt, level=log_lvl)
+
+    proc = None
+    unix = args.unix
+    if args.port is None and unix is None:
+        unix = os.path.join(tempfile.mkdtemp(), 'py-snake.sock')
+        proc = spawn_server(unix)
+    try:
+        asyncio.run(run(
+            args.mode, args.sessions, args.connections, args.seconds,
+            args.tick_ms, args.width, args.length, args.port, unix,
+        ))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
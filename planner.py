@@ -0,0 +1,423 @@
+'''
+Path planners for the AI
+
+Each planner finds a shortest path between two cells of a board (flat
+integer cells, see cells.py), avoiding blocked cells. Paths are lists of
+cells from start to target (inclusive), or an empty list if the target can't
+be reached.
+
+`find_cells` is the planners' interface; `find_path` wraps it for callers
+holding (x, y) positions, such as the arena.
+'''
+import collections
+import heapq
+import math
+
+import cells as cells_mod
+import hamilton
+import reachability
+
+
+class BlockedPositions(object):
+    '''A container of blocked positions, seen as a container of cells'''
+    __slots__ = ('blocked', 'cells')
+
+    def __init__(self, blocked, cells):
+        self.blocked = blocked
+        self.cells = cells
+
+    def __contains__(self, cell):
+        return self.cells.positions[cell] in self.blocked
+
+    def __iter__(self):
+        cell = self.cells.cell
+        return (cell(pos) for pos in self.blocked)
+
+    def __len__(self):
+        return len(self.blocked)
+
+    def last(self):
+        return self.cells.cell(self.blocked.last())
+
+    def cell_mask(self, cells):
+        return cells.mask(self.blocked)
+
+
+class Planner(object):
+    '''Base class: subclasses implement `find_cells`'''
+    name = None
+
+    # Incremental planners keep their search between calls, so are cheap to
+    # call every move as long as they're told which cells changed
+    incremental = False
+    # Safe planners never lead the snake into a trap, so their paths don't
+    # need checking (see reachability.py)
+    safe = False
+
+    def find_cells(self, start, target, blocked, cells):
+        '''
+        Find the shortest path from start to target, cells of the board
+        `cells` (a `cells.Cells`)
+
+        blocked is a container of impassable cells (e.g. the snake's body);
+        it should support O(1) membership checks.
+        '''
+        raise NotImplementedError
+
+    def find_path(self, start, target, blocked, width, length):
+        '''
+        `find_cells` for positions on a width x length board: blocked is a
+        container of positions, and so is the path returned
+
+        Incremental planners only keep their search between calls given the
+        same blocked container, so should be called through `find_cells`.
+        '''
+        cells = cells_mod.get_cells(width, length)
+        path = self.find_cells(cells.cell(start), cells.cell(target),
+                               BlockedPositions(blocked, cells), cells)
+        positions = cells.positions
+        return [positions[cell] for cell in path]
+
+    def update(self, cells):
+        '''Notify the planner that cells changed between blocked and free'''
+        pass
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}()'
+
+
+class BFSPlanner(Planner):
+    '''Breadth-first search, optimal since every move has unit cost'''
+    name = 'bfs'
+
+    def find_cells(self, start, target, blocked, cells):
+        if start == cells.wall:
+            return []
+
+        neighbors = cells.neighbors
+        closed = cells.mask_cells(blocked)  # Blocked or already queued
+        closed[start] = 1
+        prev = {}
+        queue = collections.deque([start])
+
+        while queue:
+            node = queue.popleft()
+            if node == target:
+                return cells.path(prev, start, target)
+
+            for nb_node in neighbors[node]:
+                if closed[nb_node]:
+                    continue
+                closed[nb_node] = 1
+                prev[nb_node] = node
+                queue.append(nb_node)
+
+        return []
+
+
+class DijkstraPlanner(Planner):
+    '''Dijkstra's Algorithm on a binary heap'''
+    name = 'dijkstra'
+
+    def cost(self, cells, node, nb_node):
+        '''Cost of moving from node to its neighbor nb_node'''
+        return 1
+
+    def heuristic(self, cells, node, target):
+        '''Lower bound on the cost from node to target (0 for Dijkstra)'''
+        return 0
+
+    def find_cells(self, start, target, blocked, cells):
+        if start == cells.wall:
+            return []
+
+        neighbors = cells.neighbors
+        closed = cells.closed()     # Visited (and the wall)
+        distances = {start: 0}
+        prev = {}
+
+        # (priority, -distance, node): among equal priorities, prefer the
+        # node furthest along (i.e. closest to the target)
+        heap = [(self.heuristic(cells, start, target), 0, start)]
+
+        while heap:
+            _, neg_dist, node = heapq.heappop(heap)
+            dist = -neg_dist
+            if closed[node]:
+                continue
+            closed[node] = 1
+
+            # Early exit once the target is popped: its distance is final
+            if node == target:
+                return cells.path(prev, start, target)
+
+            for nb_node in neighbors[node]:
+                if closed[nb_node] or nb_node in blocked:
+                    continue
+
+                new_distance = dist + self.cost(cells, node, nb_node)
+                if new_distance < distances.get(nb_node, new_distance + 1):
+                    distances[nb_node] = new_distance
+                    prev[nb_node] = node
+                    priority = new_distance + self.heuristic(cells, nb_node,
+                                                             target)
+                    heapq.heappush(heap, (priority, -new_distance, nb_node))
+
+        return []
+
+
+class AStarPlanner(DijkstraPlanner):
+    '''A* search guided by the Manhattan distance to the target'''
+    name = 'astar'
+
+    def heuristic(self, cells, node, target):
+        return cells.distance(node, target)
+
+
+class DStarLitePlanner(Planner):
+    '''
+    D* Lite (Koenig & Likhachev): an incremental search back from the target
+
+    The search state (g and rhs values, open queue) is kept between calls
+    while the target stays the same. The live `blocked` container passed to
+    `find_cells` is read on demand, and `update` is given the cells that
+    changed since (the new head and vacated tail), so each call only repairs
+    the part of the search those cells affect as the start (head) moves.
+    '''
+    name = 'dstar'
+    incremental = True
+
+    def __init__(self):
+        self._target = None
+        self._blocked = None
+        self._cells = None
+        self._changed = []
+
+    def _reset(self, start, target, blocked, cells):
+        self._target = target
+        self._blocked = blocked
+        self._cells = cells
+        self._neighbors = cells.neighbors
+        self._start = start
+        self._km = 0
+        self._g = {}
+        self._rhs = {target: 0}
+        self._queue = []
+        self._queued = {}   # node -> key it's (validly) queued under
+        self._changed = []
+        self._push(target)
+
+    def _cost(self, node, nb_node):
+        '''Moving into a blocked cell is impossible (the target never is)'''
+        if nb_node != self._target and nb_node in self._blocked:
+            return math.inf
+        return 1
+
+    def _key(self, node):
+        g = min(self._g.get(node, math.inf), self._rhs.get(node, math.inf))
+        h = self._cells.distance(self._start, node)
+        return (g + h + self._km, g)
+
+    def _push(self, node):
+        key = self._key(node)
+        self._queued[node] = key
+        heapq.heappush(self._queue, (key, node))
+
+    def _update_vertex(self, node):
+        if node != self._target:
+            self._rhs[node] = min(
+                self._cost(node, nb_node) + self._g.get(nb_node, math.inf)
+                for nb_node in self._neighbors[node]
+            )
+        self._queued.pop(node, None)
+        if self._g.get(node, math.inf) != self._rhs.get(node, math.inf):
+            self._push(node)
+
+    def _top(self):
+        '''Pop stale entries, return the top (key, node) or None'''
+        while self._queue:
+            key, node = self._queue[0]
+            if self._queued.get(node) == key:
+                return key, node
+            heapq.heappop(self._queue)
+        return None
+
+    def _compute(self):
+        start = self._start
+        while True:
+            top = self._top()
+            start_g = self._g.get(start, math.inf)
+            start_rhs = self._rhs.get(start, math.inf)
+            if top is None or (top[0] >= self._key(start)
+                               and start_rhs == start_g):
+                return
+
+            key, node = top
+            new_key = self._key(node)
+            g = self._g.get(node, math.inf)
+            rhs = self._rhs.get(node, math.inf)
+            if key < new_key:
+                heapq.heappop(self._queue)
+                self._push(node)
+            elif g > rhs:
+                heapq.heappop(self._queue)
+                del self._queued[node]
+                self._g[node] = rhs
+                for nb_node in self._neighbors[node]:
+                    self._update_vertex(nb_node)
+            else:
+                self._g[node] = math.inf
+                for nb_node in self._neighbors[node]:
+                    self._update_vertex(nb_node)
+                self._update_vertex(node)
+
+    def update(self, cells):
+        self._changed.extend(cells)
+
+    def find_cells(self, start, target, blocked, cells):
+        if start == cells.wall or target == cells.wall:
+            return []
+
+        if target != self._target or blocked is not self._blocked \
+                or cells is not self._cells:
+            self._reset(start, target, blocked, cells)
+        else:
+            self._km += cells.distance(self._start, start)
+            self._start = start
+            # Moving into a changed cell changed cost: update its neighbors
+            changed = set(self._changed)
+            changed.discard(cells.wall)
+            self._changed = []
+            for cell in changed:
+                for nb_node in self._neighbors[cell]:
+                    self._update_vertex(nb_node)
+
+        self._compute()
+
+        if self._g.get(start, math.inf) == math.inf:
+            return []
+
+        path = [start]
+        node = start
+        while node != target:
+            node = min(
+                self._neighbors[node],
+                key=lambda n: self._cost(node, n) + self._g.get(n, math.inf)
+            )
+            path.append(node)
+        return path
+
+
+class HamiltonianPlanner(Planner):
+    '''
+    Follows a precomputed Hamiltonian cycle, taking safe shortcuts to food
+
+    The snake's body lies along the cycle behind the head, so a neighbor
+    further along the cycle is safe to jump to as long as it stays short of
+    the tail, with room to spare for growing. Each move is an O(1) index
+    lookup per neighbor; the returned path is just the next step.
+
+    blocked must be the snake's body (a `snake.FIFOQueue`), so the tail can
+    be found. Needs a board with an even number of rows or columns.
+    '''
+    name = 'hamilton'
+    incremental = True
+    safe = True
+
+    # Cells kept free between the head and the tail when shortcutting
+    margin = 4
+    # Stop shortcutting once the snake covers this fraction of the board
+    max_fill = 0.5
+
+    def find_cells(self, start, target, blocked, cells):
+        cycle = hamilton.get_cycle(cells.width, cells.length)
+        tail = blocked.last()
+
+        nxt = cycle.next(start)
+        if nxt in blocked and nxt != tail:
+            return []
+
+        if len(blocked) < self.max_fill * cycle.size:
+            to_target = cycle.distance(start, target)
+            to_tail = cycle.distance(start, tail)
+            best = cycle.distance(start, nxt)
+            for nb_node in cells.neighbors[start]:
+                if nb_node in blocked:
+                    continue
+                dist = cycle.distance(start, nb_node)
+                if best < dist <= to_target \
+                        and dist < to_tail - self.margin:
+                    nxt, best = nb_node, dist
+
+        return [start, nxt]
+
+
+PLANNERS = {
+    cls.name: cls for cls in (
+        BFSPlanner, DijkstraPlanner, AStarPlanner, DStarLitePlanner,
+        HamiltonianPlanner,
+    )
+}
+
+
+def get_planner(name):
+    '''Instantiate the planner registered under name'''
+    try:
+        return PLANNERS[name]()
+    except KeyError:
+        raise ValueError(
+            f'Unknown planner {name!r}, expected one of: {list(PLANNERS)}'
+        )
+
+
+class PlannerPolicy(object):
+    '''
+    Drives an `engine.SnakeEnv` the way `player.AIPlayer` drives a `Game`:
+    plans a path whenever new food appears, then follows it step by step
+    '''
+    def __init__(self, planner='astar', safety=True):
+        self.planner = planner if isinstance(planner, Planner) \
+            else get_planner(planner)
+        self.safety = safety and not self.planner.safe
+        self.path = None
+        self.path_step = None
+        self._food = None
+        self._tail = None
+
+    def has_path(self):
+        return self.path is not None and len(self.path) > 1
+
+    def __call__(self, env):
+        # Tell the planner which cells changed since the last move
+        tail = env.snake.last()
+        if env.mv_cnt > 0:
+            changed = [env.head()]
+            if tail != self._tail:
+                changed.append(self._tail)
+            self.planner.update(changed)
+        self._tail = tail
+
+        if self.path_step is not None:
+            self.path_step += 1
+
+        if env.mv_cnt == 0 or env.food != self._food \
+                or self.planner.incremental \
+                or self.path_step >= len(self.path) - 1:
+            self._food = env.food
+            if env.food is None:
+                self.path = None
+                return None
+            self.path = self.planner.find_cells(
+                env.head(), env.food, env.snake.pos, env.cells
+            )
+            if self.safety:
+                reach = reachability.get_reachability(env.width, env.length)
+                free = reach.free_from_body(env.snake.pos)
+                self.path = reach.safe_path(env.snake.pos, self.path, free)
+            self.path_step = 0
+
+        if not self.has_path() or self.path_step >= len(self.path) - 1:
+            return None
+
+        i = self.path_step
+        return env.cells.direction(self.path[i], self.path[i + 1])
@@ -1,9 +1,15 @@
 import logging
-from numpy import Inf
+import time
+
 import pygame
 
+import board as board_mod
 import config
+import planner as planner_mod
+import reachability
+import search
 import snake
+import worker as worker_mod
 
 
 def get_inverted_key(key, controls):
@@ -17,35 +23,40 @@ def get_inverted_key(key, controls):
 
 
 class Player(snake.Snake):
+    '''A snake on a Board; its body holds board cells (see cells.py)'''
     def __init__(self, board, pos=config.starting_pos):
         self.board = board
-        super().__init__(config.starting_pos)
+        self.cells = board.cells
+        super().__init__([self.cells.cell(p) for p in pos],
+                         size=self.cells.size + 1)
+
+        for p in self.pos:
+            self.board.set_state(p, board_mod.BODY)
+        self.board.set_state(self.head(), board_mod.HEAD)
 
         self.controls = config.control_sets['right']
         self.last_key = None
         self.deactiv_key = None
+        self.direction = None   # Of the last move, e.g. 'up'
 
         # Logging Config
         self.log = logging.getLogger(self.__class__.__name__)
         self.mv_cnt = 0     # Move counter
+        self.profiler = None    # Optional profiler.FrameProfiler
 
     def get_spaces(self):
-        return [self.board[x, y] for x, y in self.pos]
+        return [self.board[cell] for cell in self.pos]
 
     def is_outside(self):
-        '''
-        Check if any positions are outside the board -> will throw IndexError
-        '''
-        try:
-            self.get_spaces()
-            return False
-        except IndexError:
+        '''Check if the head left the board (the body follows the head)'''
+        if self.head() == self.cells.wall:
             self.log.info(f'({self.mv_cnt}) Snake is outside')
             return True
+        return False
 
     def is_overlap(self):
         '''Check if any positions are duplicated (snake eats itself)'''
-        if len(self.pos) != len(set(self.pos)):
+        if self.pos.has_duplicates():
             self.log.info(f'({self.mv_cnt}) Snake ate itself')
             return True
         return False
@@ -53,29 +64,44 @@ class Player(snake.Snake):
     def eat_food(self):
         self.log.info(f'({self.mv_cnt}) Eating food')
         self.pos.add_cappacity(1)
-        self.board.color = config.background_color
 
-    def slither(self, delta):
+    def slither(self, direction):
         '''
-        Slither (delta_x, delta_y) to the next position
+        Slither in direction (e.g. 'up') to the next cell
 
-        If next position is food, increases position capacity by 1
+        If next cell is food, eats it (removing it from the board's food
+        registry) and increases position capacity by 1
 
-        Adds the next position
+        Adds the next cell (the wall if it's off the board), updating the
+        board's cell states
         '''
 
-        head_pos = self.head()
-        next_pos = (head_pos[0] + delta[0], head_pos[1] + delta[1])
+        head = self.head()
+        nxt = self.cells.step(head, direction)
+        self.direction = direction
+
+        self.log.debug(f'({self.mv_cnt}) Moving from {head} to {nxt}')
+
+        if nxt in self.board.foods:
+            self.eat_food()
+            self.board.foods.remove(nxt)
 
-        self.log.debug(f'({self.mv_cnt}) Moving from {head_pos} to {next_pos}')
+        tail = self.pos.add(nxt)
 
-        try:
-            if self.board[next_pos].color == config.food_color:
-                self.eat_food()
-        except IndexError:
-            pass
+        self.board.set_state(head, board_mod.BODY)
+        if tail is not None and tail not in self.pos:
+            self.board.set_state(tail, board_mod.EMPTY)
+        self.board.set_state(nxt, board_mod.HEAD)
 
-        self.pos.add(next_pos)
+        self.moved(nxt, tail)
+
+    def moved(self, head, tail):
+        '''Called after a move with the new head and dropped tail (or None)'''
+        pass
+
+    def stop(self):
+        '''Called once the game is over'''
+        pass
 
     def move(self):
         '''
@@ -93,23 +119,25 @@ class Player(snake.Snake):
         elif self.last_key == self.deactiv_key:
             self.last_key = get_inverted_key(self.deactiv_key, self.controls)
 
-        # Map controls to a (position delta, deactive key)
+        # Map controls to a (direction, deactive key)
         control_map = {
-            self.controls['down']:  ((0, 1), self.controls['up']),
-            self.controls['up']:    ((0, -1), self.controls['down']),
-            self.controls['left']:  ((-1, 0), self.controls['right']),
-            self.controls['right']: ((1, 0), self.controls['left'])
+            self.controls['down']:  ('down', self.controls['up']),
+            self.controls['up']:    ('up', self.controls['down']),
+            self.controls['left']:  ('left', self.controls['right']),
+            self.controls['right']: ('right', self.controls['left'])
         }
 
-        delta, deactivated_key = control_map[self.last_key]
+        direction, deactivated_key = control_map[self.last_key]
 
-        self.slither(delta)
+        self.slither(direction)
         self.deactiv_key = deactivated_key
 
     def draw(self, screen):
-        for pos in self.__iter__():
-            color = self.head_color if pos == self.head() else self.color
-            self.board[pos].draw(screen, color)
+        for cell in self.__iter__():
+            if cell == self.cells.wall:
+                continue
+            color = self.head_color if cell == self.head() else self.color
+            self.board[cell].draw(screen, color)
 
     def get_score(self):
         return self.pos.get_capacity() * 100
@@ -129,40 +157,91 @@ class HumanPlayer(Player):
 
 
 class AIPlayer(Player):
-    def __init__(self, *args, **kwargs):
+    '''
+    Follows paths to the food found by a planner
+
+    With worker=True, paths are planned on a background thread
+    (`worker.PlanWorker`) and each move uses whatever plan is ready.
+    '''
+    def __init__(self, *args, planner='astar', safety=True, worker=False,
+                 **kwargs):
         super().__init__(*args, **kwargs)
         self.path = None
+        self.planner = planner if isinstance(planner, planner_mod.Planner) \
+            else planner_mod.get_planner(planner)
 
-        self.delta_mapping = {
-            (-1, 0): 'left',
-            (1, 0): 'right',
-            (0, -1): 'up',
-            (0, 1): 'down'
-        }
+        # Reject paths after which the snake can't reach its tail
+        self.safety = safety and not self.planner.safe
+        self._reach = None      # Built on first use, see get_reach
 
-        # Map the delta -> key
+        # Start moving in the direction the body points
         self.last_key = self.get_key(
-                self.get_delta(self.pos[1], self.pos[0])
+                self.cells.direction(self.pos[1], self.pos[0])
         )
         self.path_step = None
 
-    def get_key(self, delta):
-        direction = self.delta_mapping[delta]
+        self.worker = None
+        self._plan = None       # Last plan taken from the worker
+        self._requested = False
+        self._moves = 0         # Moves posted to the worker
+        if worker:
+            # Fallback moves can take the snake off even a safe planner's
+            # course, so the worker checks every path
+            self.worker = worker_mod.PlanWorker(
+                self.planner, self.pos, self.board.width, self.board.length,
+                safety
+            ).start()
+
+    def get_key(self, direction):
         return self.controls[direction]
 
-    @staticmethod
-    def get_delta(a, b):
-        '''Calculate the delta to move from point a to b'''
-        return (b[0] - a[0], b[1] - a[1]) 
-
     def eat_food(self):
         super().eat_food()
-        self.log.debug(f'({self.mv_cnt}) Resetting path step')
-        self.path_step = None
+        if self.worker is None:
+            self.log.debug(f'({self.mv_cnt}) Resetting path step')
+            self.path_step = None
+
+    def moved(self, head, tail):
+        if self.worker is not None:
+            self._moves += 1
+            self.worker.moved(head, self.pos.get_capacity())
+            return
+        # Tell the planner which cells changed between blocked and free
+        self.planner.update([head] if tail is None else [head, tail])
 
-    def react_to(self, **kwargs):
+    def stop(self):
+        if self.worker is not None:
+            self.worker.stop()
+
+    def is_path_blocked(self):
+        '''Check if the next step on the path has been blocked'''
+        i = self.path_step
+        return self.path is not None and i + 1 < len(self.path) \
+            and self.path[i + 1] in self.pos
+
+    def react_to(self, wait=False, **kwargs):
+        '''
+        Steer towards the food
+
+        With a worker, wait=True waits for the plans it requests (e.g. when
+        moves are simulated faster than the worker could keep up).
+        '''
         self.log.debug(f'({self.mv_cnt}) Current Position: {self.head()}')
 
+        if self.worker is not None:
+            self.react_async(wait)
+            return
+
+        if self.path_step is not None:
+            # Increment path step
+            self.path_step += 1
+
+            # Incremental planners repair the path every move, others only
+            # replan if the path got blocked or ran out
+            if self.planner.incremental or self.is_path_blocked() \
+                    or self.path_step >= len(self.path) - 1:
+                self.path_step = None
+
         # Path step missing -> find new path
         if self.path_step is None:
             food = self.find_food()
@@ -170,14 +249,21 @@ class AIPlayer(Player):
                 self.log.debug(f'({self.mv_cnt}) No food on board')
                 return
 
+            start = time.perf_counter()
             self.path = self.find_path(food)
+            if self.profiler is not None:
+                self.profiler.record('plan', time.perf_counter() - start)
+
+            if self.safety:
+                start = time.perf_counter()
+                self.path = self.safe_path(self.path)
+                if self.profiler is not None:
+                    self.profiler.record('safety', time.perf_counter() - start)
             self.path_step = 0
-        else:
-            # Otherwise increment path step
-            self.path_step += 1
 
         # Log Current Path
-        self.log.debug(f'({self.mv_cnt}) Current Path [{self.path_step}/{len(self.path)}]: {self.path}')
+        self.log.debug(f'({self.mv_cnt}) Current Path '
+                       f'[{self.path_step}/{len(self.path)}]: {self.path}')
 
         # If path is missing or no step to take -> report no decision
         if self.path is None or len(self.path) <= 1:
@@ -187,92 +273,161 @@ class AIPlayer(Player):
         # If still steps to take -> take step
         if self.path_step < len(self.path) - 1:
             i = self.path_step
-            delta = self.get_delta(self.path[i], self.path[i+1])
-            self.log.debug(f'({self.mv_cnt}) Delta ({self.delta_mapping[delta]}): {delta} = {self.path[i+1]} - {self.path[i]}')
-            self.last_key = self.get_key(delta)
+            direction = self.cells.direction(self.path[i], self.path[i+1])
+            self.log.debug(f'({self.mv_cnt}) Direction {direction}: '
+                           f'{self.path[i]} -> {self.path[i+1]}')
+            self.last_key = self.get_key(direction)
         else:
             # Otherwise reset path step -> calculate new step on next loop
             self.log.warn(f'({self.mv_cnt}) No steps left to take')
 
+    def take_plan(self):
+        '''
+        Pick up the worker's latest plan if it's new, return whether it was
+
+        A plan made a few moves ago is picked up where the snake is now if it
+        has been moving along it since.
+        '''
+        plan = self.worker.result()
+        if plan is None or plan is self._plan:
+            return False
+
+        self._plan = plan
+        self._requested = False
+        if self.profiler is not None:
+            self.profiler.record('plan', plan.seconds)
+        head = self.head()
+        i = self._moves - plan.move
+        on_path = plan.path and i < len(plan.path) and plan.path[i] == head
+        self.path = plan.path if on_path else None
+        self.path_step = i if on_path else None
+        return True
+
+    def react_async(self, wait=False):
+        '''
+        Steer by the latest plan from the worker (see `take_plan`)
+
+        Unless wait is set, never waits for a plan: without a usable path,
+        the snake keeps its last direction while that's safe (see
+        `fallback`).
+        '''
+        head = self.head()
+        if not self.take_plan() and self.path is not None:
+            # Advance along the path, dropping it if the snake strayed off
+            i = self.path_step
+            if i + 1 < len(self.path) and self.path[i + 1] == head:
+                self.path_step += 1
+            else:
+                self.path = self.path_step = None
+
+        food = self.find_food()
+        needs_plan = self.path is None or self.planner.incremental \
+            or self.path_step >= len(self.path) - 1 \
+            or self.is_path_blocked() or self._plan.target != food
+        if needs_plan and food is not None and not self._requested:
+            self.worker.request(food)
+            self._requested = True
+        if wait and self._requested:
+            self.worker.wait()
+            self.take_plan()
+
+        if self.path is not None and self.path_step < len(self.path) - 1 \
+                and not self.is_path_blocked():
+            i = self.path_step
+            self.last_key = self.get_key(
+                self.cells.direction(self.path[i], self.path[i + 1])
+            )
+        else:
+            self.fallback()
+
+    def get_reach(self):
+        '''The board's `reachability.Reachability`, for safety and fallback'''
+        if self._reach is None:
+            self._reach = reachability.get_reachability(
+                self.board.width, self.board.length
+            )
+        return self._reach
+
+    def fallback(self):
+        '''
+        Keep moving in the current direction while the tail stays reachable
+        from it, otherwise take the best-rated move (see
+        `reachability.rate_moves`)
+        '''
+        reach = self.get_reach()
+        free = reach.free_from_grid(
+            self.board.grid, [board_mod.EMPTY, board_mod.FOOD]
+        )
+        ratings = reach.rate_moves(self.pos, free)
+        if not ratings:
+            return
+
+        head = self.head()
+        for direction, key in self.controls.items():
+            if key == self.last_key:
+                nxt = self.cells.step(head, direction)
+                if ratings.get(nxt, (False,))[0]:
+                    return
+
+        best = max(ratings, key=ratings.get)
+        self.last_key = self.get_key(self.cells.direction(head, best))
+
     def find_path(self, target_node):
         '''
-        Finds the shortest path from the head node to the target node
-        using Dijkstra's Algorithm
+        Finds the shortest path from the head cell to the target cell
+        using the player's planner (see planner.py)
         '''
-        starting_node = self.head()
+        return self.planner.find_cells(
+            self.head(), target_node, self.pos, self.cells
+        )
 
-        # Set of all visited nodes
-        unvisited = {(x, y) for x in range(self.board.width)
-                     for y in range(self.board.length)}
+    def safe_path(self, path):
+        '''
+        The path if the snake can still reach its tail after following it,
+        otherwise the safest single move (see `reachability.safe_path`)
+        '''
+        reach = self.get_reach()
+        free = reach.free_from_grid(
+            self.board.grid, [board_mod.EMPTY, board_mod.FOOD]
+        )
+        return reach.safe_path(self.pos, path, free)
 
-        # Init distances to all nodes as Inf
-        distances = {
-            (x, y): Inf
-            for x in range(self.board.width)
-            for y in range(self.board.length)
-        }
-        # Dict of node previous to key
-        prev = {}
+    def find_food(self):
+        '''The food closest to the head, or None'''
+        return self.board.foods.nearest(self.head())
 
-        # Init distance to starting node as 0
-        distances[starting_node] = 0
 
-        def min_distance_node(unvisited):
-            unvis_dist = {k: v for k, v in distances.items() if k in unvisited}
-            min_dist_nodes = [
-                node for node in unvisited
-                if unvis_dist[node] == min(unvis_dist.values())
+class SearchPlayer(Player):
+    '''
+    Steers by a lookahead search over moves and future food placements
+    (see `search.Searcher`), taking up to budget seconds a move
+    '''
+    def __init__(self, *args, budget=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.searcher = search.Searcher(
+            self.board.width, self.board.length, budget
+        )
+        # Start moving in the direction the body points
+        self.last_key = self.controls[
+            self.cells.direction(self.pos[1], self.pos[0])
+        ]
+
+    def react_to(self, **kwargs):
+        start = time.perf_counter()
+        nxt = self.searcher.search(self.pos, self.find_food())
+        if self.profiler is not None:
+            self.profiler.record('plan', time.perf_counter() - start)
+
+        if nxt is not None:
+            self.last_key = self.controls[
+                self.cells.direction(self.head(), nxt)
             ]
-            if len(min_dist_nodes) == 0:
-                return None
-            return min_dist_nodes[0]
-
-        def is_valid(node):
-            return 0 <= node[0] < self.board.width \
-                and 0 <= node[1] < self.board.length \
-                and node not in self.pos
-
-        def get_neighbors(node):
-            x, y = node
-            nodes = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
-            return [node
-                    for node in nodes
-                    if is_valid(node) and node in unvisited]
-
-        path = []
-
-        while len(unvisited) != 0:
-            # Visit the unvisted node w/ min distance from source
-            node = min_distance_node(unvisited)
-            unvisited.remove(node)                  # Mark as visited
-
-            # For each neighbor
-            for nb_node in get_neighbors(node):
-                new_distance = distances[node] + 1  # Calc dist
-                if new_distance < distances[nb_node]:
-                    # Update improvements
-                    distances[nb_node] = new_distance
-                    prev[nb_node] = node
-
-            if node == target_node:
-                if prev.get(node, None) is not None:
-                    # iterate backwards over nodes for shortest path
-                    while node is not None:
-                        path = [node] + path
-                        node = prev[node]
-                        if node == starting_node:
-                            path = [node] + path
-                            break
-
-        return path
+
+    def stop(self):
+        searcher = self.searcher
+        self.log.info(f'Searched {searcher.nodes:,} nodes at '
+                      f'{searcher.nodes_per_sec():,.0f} nodes/s')
 
     def find_food(self):
-        food = [
-            (x, y)
-            for x in range(self.board.width)
-            for y in range(self.board.length)
-            if self.board[x, y].color == config.food_color
-        ]
-        if len(food) > 0:
-            return food[0]
-        return None
+        '''The food closest to the head, or None'''
+        return self.board.foods.nearest(self.head())
@@ -0,0 +1,104 @@
+'''
+Low-overhead per-phase frame timing
+
+Each phase of a frame (input, planning, moving, game events, drawing, ...)
+records its duration into a fixed-size ring buffer, from which rolling
+p50/p95/max are computed on demand.
+'''
+import json
+import time
+
+import numpy as np
+
+
+class RingBuffer(object):
+    '''Fixed-size buffer of the most recent float samples'''
+    def __init__(self, size):
+        self._data = np.zeros(size)
+        self._i = 0         # Total samples recorded
+
+    def __len__(self):
+        return min(self._i, len(self._data))
+
+    def append(self, value):
+        self._data[self._i % len(self._data)] = value
+        self._i += 1
+
+    def count(self):
+        return self._i
+
+    def values(self):
+        '''The samples currently held, oldest first'''
+        if self._i <= len(self._data):
+            return self._data[:self._i].copy()
+        i = self._i % len(self._data)
+        return np.concatenate([self._data[i:], self._data[:i]])
+
+
+class FrameProfiler(object):
+    '''
+    Times named phases of the game loop
+
+    Usage:
+        t = profiler.start()
+        do_input()
+        t = profiler.lap('input', t)
+        do_move()
+        t = profiler.lap('move', t)
+    '''
+    def __init__(self, size=256):
+        self.size = size
+        self._phases = {}
+
+    def start(self):
+        return time.perf_counter()
+
+    def record(self, phase, seconds):
+        buf = self._phases.get(phase)
+        if buf is None:
+            buf = self._phases[phase] = RingBuffer(self.size)
+        buf.append(seconds)
+
+    def lap(self, phase, start):
+        '''Record the time since start under phase, return the current time'''
+        now = time.perf_counter()
+        self.record(phase, now - start)
+        return now
+
+    def phases(self):
+        return list(self._phases)
+
+    def stats(self):
+        '''Rolling {phase: {count, p50_ms, p95_ms, max_ms}}'''
+        out = {}
+        for phase, buf in self._phases.items():
+            ms = buf.values() * 1000
+            out[phase] = dict(
+                count=buf.count(),
+                p50_ms=float(np.percentile(ms, 50)),
+                p95_ms=float(np.percentile(ms, 95)),
+                max_ms=float(ms.max()),
+            )
+        return out
+
+    def lines(self):
+        '''The stats as lines of text'''
+        lines = [f'{"phase":<11}{"p50":>8}{"p95":>8}{"max":>8} ms']
+        for phase, s in self.stats().items():
+            lines.append(
+                f'{phase:<11}{s["p50_ms"]:>8.2f}{s["p95_ms"]:>8.2f}'
+                f'{s["max_ms"]:>8.2f}'
+            )
+        return lines
+
+    def dump(self, path):
+        '''Write the stats and the buffered samples (ms) to path as JSON'''
+        data = {
+            phase: dict(
+                stats,
+                samples_ms=(self._phases[phase].values() * 1000).tolist()
+            )
+            for phase, stats in self.stats().items()
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
@@ -0,0 +1,156 @@
+'''
+Reachability checks for the AI's move selection
+
+Free cells are held as a bitset in a Python int, one bit per cell plus a
+padding column per row so shifting a row's last bit left never wraps into
+the next row. A flood fill is then a handful of shifts, ors and ands per
+step over the whole board:
+
+    reached = (reached | reached << 1 | reached >> 1
+               | reached << stride | reached >> stride) & free
+
+Bodies and paths are lists of cells (see cells.py).
+'''
+import functools
+
+import numpy as np
+
+import cells as cells_mod
+
+
+class Reachability(object):
+    '''Bitset flood fills on a width x length board'''
+    def __init__(self, width, length):
+        self.width = width
+        self.length = length
+        self.stride = width + 1
+        self.cells = cells_mod.get_cells(width, length)
+
+        row = (1 << width) - 1
+        self.board = 0      # All cells on the board
+        for y in range(length):
+            self.board |= row << (y * self.stride)
+
+    def bit(self, cell):
+        '''The bit of cell (y * width + x) at y * stride + x'''
+        return 1 << (cell + cell // self.width)
+
+    def mask(self, cells):
+        width = self.width
+        out = 0
+        for cell in cells:
+            out |= 1 << (cell + cell // width)
+        return out
+
+    def free_from_body(self, body):
+        '''Free cells of a board holding only body'''
+        return self.board & ~self.mask(body)
+
+    def free_from_grid(self, grid, states):
+        '''Free cells of a (length, width) grid: cells in any of states'''
+        free = np.isin(grid, states)
+        padded = np.zeros((self.length, self.stride), dtype=bool)
+        padded[:, :self.width] = free
+        packed = np.packbits(padded.ravel(), bitorder='little')
+        return int.from_bytes(packed.tobytes(), 'little')
+
+    def flood(self, start, free, stop=0):
+        '''
+        Cells reachable from the cell start (a bit) through free
+
+        Stops early once any cell of stop is reached.
+        '''
+        stride = self.stride
+        reached = start
+        while True:
+            grown = (reached | reached << 1 | reached >> 1
+                     | reached << stride | reached >> stride) & free | start
+            if grown == reached or grown & stop:
+                return grown
+            reached = grown
+
+    def count_reachable(self, cell, free):
+        '''Number of free cells reachable from cell (excluding cell)'''
+        start = self.bit(cell)
+        return (self.flood(start, free) & ~start).bit_count()
+
+    def after_path(self, body, path, free, grow=1):
+        '''
+        Simulate the snake following path, growing by grow on the last move
+
+        body is the snake's body (head first, e.g. a `snake.FIFOQueue`); it
+        isn't modified. Only the cells entering and leaving the body are
+        touched. Returns (free cells, head, tail) after the path.
+        '''
+        new_cells = path[:0:-1]     # New head first
+        k = len(new_cells)
+        grow = grow if k else 0
+        n = len(body) + grow        # Length after the path
+
+        # Cells the tail leaves (and path cells it already left again)
+        if k >= n:
+            dropped = list(body) + new_cells[n:]
+            tail = new_cells[n - 1]
+        else:
+            dropped = [body[len(body) - 1 - i] for i in range(k - grow)]
+            tail = body[n - 1 - k]
+
+        bit = self.bit
+        for cell in dropped:
+            free |= bit(cell)
+        for cell in new_cells[:n]:
+            free &= ~bit(cell)
+
+        head = path[-1] if k else body[0]
+        return free, head, tail
+
+    def can_reach_tail(self, body, path, free, grow=1):
+        '''Check if the tail is still reachable after following path'''
+        free, head, tail = self.after_path(body, path, free, grow)
+        tail_bit = self.bit(tail)
+        return bool(self.flood(self.bit(head), free | tail_bit, tail_bit)
+                    & tail_bit)
+
+    def rate_moves(self, body, free):
+        '''
+        Rate each move from the head by (tail reachable, free cells reachable)
+
+        Returns {neighbor: rating} for the neighbors the head can move to.
+        '''
+        head, tail = body[0], body[len(body) - 1]
+        bit = self.bit
+        ratings = {}
+        for nb_node in self.cells.neighbors[head]:
+            if not free & bit(nb_node) and nb_node != tail:
+                continue
+            after, _, new_tail = \
+                self.after_path(body, [head, nb_node], free, grow=0)
+            tail_bit = bit(new_tail)
+            reached = self.flood(bit(nb_node), after | tail_bit)
+            ratings[nb_node] = (
+                bool(reached & tail_bit),
+                (reached & after).bit_count(),
+            )
+        return ratings
+
+    def safe_path(self, body, path, free):
+        '''
+        Path if the snake can still reach its tail after following it
+
+        Otherwise the single best-rated move (see `rate_moves`), which keeps
+        the snake alive while the body moves out of the way, or path if no
+        move is possible.
+        '''
+        if len(path) > 1 and self.can_reach_tail(body, path, free):
+            return path
+
+        ratings = self.rate_moves(body, free)
+        if not ratings:
+            return path
+        best = max(ratings, key=ratings.get)
+        return [body[0], best]
+
+
+@functools.lru_cache(maxsize=8)
+def get_reachability(width, length):
+    return Reachability(width, length)
@@ -0,0 +1,96 @@
+import numpy as np
+import pygame
+
+import board
+import config
+
+
+STATE_COLORS = board.STATE_COLORS
+
+
+class Renderer(object):
+    '''
+    Draws the board incrementally
+
+    Keeps a pre-rendered background and the cell states as last drawn, so each
+    frame only redraws the cells whose state changed (new head, vacated tail,
+    old and new food) plus the overlays (AI path, text). `draw` returns the
+    dirty rects to pass to `pygame.display.update`.
+    '''
+    def __init__(self, screen, board):
+        self.screen = screen
+        self.board = board
+
+        self.background = pygame.Surface(screen.get_size())
+        self.background.fill(config.background_color)
+
+        self._drawn = None          # Cell states as last drawn
+        self._path_cells = []       # Cells under last frame's path
+        self._text_rects = []       # Areas under last frame's text
+
+    def _draw_cell(self, cell):
+        space = self.board[cell]
+        space.draw(self.screen, STATE_COLORS[self.board.get_state(cell)])
+        return space.get_rect()
+
+    def _cells_in(self, rect):
+        '''Board cells overlapping rect'''
+        dx, dy = config.space_dim
+        width = self.board.width
+        x0 = max(rect.left // dx, 0)
+        x1 = min((rect.right - 1) // dx, width - 1)
+        y0 = max(rect.top // dy, 0)
+        y1 = min((rect.bottom - 1) // dy, self.board.length - 1)
+        return [y * width + x
+                for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+    def _restore(self, rect):
+        '''Redraw the board underneath rect'''
+        self.screen.blit(self.background, rect, rect)
+        for cell in self._cells_in(rect):
+            if self.board.get_state(cell) != board.EMPTY:
+                self._draw_cell(cell)
+        return rect
+
+    def reset(self):
+        '''Redraw the whole board, e.g. after the screen was drawn over'''
+        self.screen.blit(self.background, (0, 0))
+        self._drawn = self.board.snapshot()
+        for cell in np.flatnonzero(self._drawn != board.EMPTY).tolist():
+            self._draw_cell(cell)
+
+        self._path_cells = []
+        self._text_rects = []
+        return [self.screen.get_rect()]
+
+    def draw(self, path=None, texts=()):
+        '''Draw the changes since the last frame, return the dirty rects'''
+        if self._drawn is None:
+            dirty = self.reset()
+        else:
+            dirty = []
+            changed = np.flatnonzero(self.board.grid != self._drawn)
+            for cell in changed.tolist():
+                dirty.append(self._draw_cell(cell))
+            np.copyto(self._drawn, self.board.grid)
+
+        # Clear last frame's overlays
+        for cell in self._path_cells:
+            dirty.append(self._draw_cell(cell))
+        for rect in self._text_rects:
+            dirty.append(self._restore(rect))
+
+        # Draw this frame's overlays (path is a list of cells)
+        self._path_cells = []
+        if path is not None and len(path) > 1:
+            self._path_cells = list(path)
+            pygame.draw.lines(
+                self.screen, config.red, False,
+                [self.board[cell].get_rect().center for cell in path]
+            )
+            dirty.extend(self.board[cell].get_rect() for cell in path)
+
+        self._text_rects = [text.draw(self.screen) for text in texts]
+        dirty.extend(self._text_rects)
+
+        return dirty
@@ -0,0 +1,406 @@
+'''
+Game recordings: compact binary replays with fast seeking
+
+A replay holds a game's board configuration and seed, the direction of every
+move (2 bits each) and every food placement, which is enough to re-run the
+game headlessly with `engine.SnakeEnv`. Snapshots of the body are stored as
+keyframes every `interval` moves, so seeking to any move restores the
+nearest keyframe (found by bisection) and re-runs at most `interval` moves.
+
+File layout (little-endian), everything after the header zlib-compressed:
+
+    magic       b'PYSNAKE' + version byte
+    header      uint32 length + JSON (board, seed, counts, ...)
+    moves       packed 2-bit indices into engine.ACTIONS, 4 per byte
+    foods       uint32 flat cell (y * width + x) per food placed
+    keyframes   per keyframe: uint32 move, food count, capacity, body length,
+                head cell; uint8 direction, deactivated direction (255 for
+                none); then the body as packed 2-bit directions from each
+                segment to the next, head to tail
+
+Play one back with:
+
+    python -m replay replays/replay-0.snk --speed 20 --move 1500
+'''
+import argparse
+import bisect
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+import cells as cells_mod
+import config
+import engine
+import snake
+
+
+MAGIC = b'PYSNAKE\x01'
+NONE = 255      # No (deactivated) direction
+KEYFRAME = struct.Struct('<IIIIIBB')
+
+
+def pack_2bit(values):
+    '''Pack a sequence of ints in [0, 4) four per byte'''
+    v = np.asarray(values, dtype=np.uint8)
+    v = np.concatenate([v, np.zeros(-len(v) % 4, dtype=np.uint8)])
+    packed = v[0::4] | v[1::4] << 2 | v[2::4] << 4 | v[3::4] << 6
+    return packed.astype(np.uint8).tobytes()
+
+
+def unpack_2bit(data, n):
+    b = np.frombuffer(data, dtype=np.uint8)
+    v = np.stack([b & 3, b >> 2 & 3, b >> 4 & 3, b >> 6 & 3], axis=1)
+    return v.ravel()[:n]
+
+
+def direction_index(direction):
+    return NONE if direction is None else engine.ACTIONS.index(direction)
+
+
+def index_direction(i):
+    return None if i == NONE else engine.ACTIONS[i]
+
+
+class Keyframe(object):
+    '''The state of a game after a number of moves'''
+    def __init__(self, move, food_cnt, capacity, body, direction, deactiv):
+        self.move = move
+        self.food_cnt = food_cnt
+        self.capacity = capacity
+        self.body = body
+        self.direction = direction
+        self.deactiv = deactiv
+
+    @classmethod
+    def from_env(cls, env):
+        return cls(env.mv_cnt, env.food_cnt, env.snake.pos.get_capacity(),
+                   list(env.snake.pos), env.direction, env.deactiv_direction)
+
+    def to_bytes(self, cells):
+        '''The keyframe of a game on the board `cells` (a `cells.Cells`)'''
+        dirs = [direction_index(cells.direction(a, b))
+                for a, b in zip(self.body, self.body[1:])]
+        return KEYFRAME.pack(
+            self.move, self.food_cnt, self.capacity, len(self.body),
+            self.body[0], direction_index(self.direction),
+            direction_index(self.deactiv),
+        ) + pack_2bit(dirs)
+
+    @classmethod
+    def from_bytes(cls, data, offset, cells):
+        '''Parse the keyframe at offset, return it and the next offset'''
+        move, food_cnt, capacity, n, head, direction, deactiv = \
+            KEYFRAME.unpack_from(data, offset)
+        offset += KEYFRAME.size
+        size = (n - 1 + 3) // 4
+        dirs = unpack_2bit(data[offset:offset + size], n - 1)
+
+        body = [head]
+        for i in dirs.tolist():
+            body.append(cells.step(body[-1], engine.ACTIONS[i]))
+
+        keyframe = cls(move, food_cnt, capacity, body,
+                       index_direction(direction), index_direction(deactiv))
+        return keyframe, offset + size
+
+
+class ReplayEnv(engine.SnakeEnv):
+    '''A SnakeEnv placing food where it was placed in the recorded game'''
+    def __init__(self, replay):
+        super().__init__(replay.width, replay.length, replay.starting_pos)
+        self.foods = replay.foods
+        self.food_cnt = 0
+
+    def reset(self, seed=None):
+        self.food_cnt = 0
+        return super().reset(seed)
+
+    def reset_food(self):
+        if self.food_cnt >= len(self.foods):
+            self.food = None
+            return None
+        self.food = self.foods[self.food_cnt]
+        self.food_cnt += 1
+        return self.food
+
+    def restore(self, keyframe):
+        '''Jump to the state of keyframe'''
+        self.snake = snake.Snake(keyframe.body, size=self.cells.size + 1)
+        self.snake.pos.set_capacity(keyframe.capacity)
+        self.reset_free()
+        self.food_cnt = keyframe.food_cnt
+        self.food = self.foods[self.food_cnt - 1] if self.food_cnt else None
+        self.direction = keyframe.direction
+        self.deactiv_direction = keyframe.deactiv
+        self.mv_cnt = keyframe.move
+        self.stall_cnt = 0
+        self.done = False
+        self.cause = None
+
+
+class Replay(object):
+    '''A recorded game'''
+    def __init__(self, width, length, starting_pos, seed=None, meta=None,
+                 moves=None, foods=None, interval=1000):
+        self.width = width
+        self.length = length
+        self.starting_pos = [tuple(p) for p in starting_pos]
+        self.seed = seed
+        self.meta = meta or {}
+        self.moves = list(moves or [])   # Directions, e.g. 'up'
+        self.foods = list(foods or [])   # Food cells, in order
+        self.interval = interval
+        self.keyframes = []
+        self._keys = []         # Moves of the keyframes, for seek
+
+    def __len__(self):
+        return len(self.moves)
+
+    def build_keyframes(self):
+        '''Re-run the game, snapshotting it every interval moves'''
+        env = ReplayEnv(self)
+        env.reset()
+        self.keyframes = [Keyframe.from_env(env)]
+        self._keys = []
+        for direction in self.moves:
+            if env.done:
+                break
+            env.step(direction)
+            # A keyframe of the final move would hold the dead snake
+            if env.mv_cnt % self.interval == 0 and not env.done:
+                self.keyframes.append(Keyframe.from_env(env))
+        self.meta['cause'] = env.cause
+        self.meta['score'] = env.get_score()
+
+    def seek(self, move, env=None):
+        '''
+        A ReplayEnv at the state after move moves
+
+        Restores the last keyframe at or before move, then re-runs the
+        moves after it. Pass env to reuse it.
+        '''
+        if not self.keyframes:
+            self.build_keyframes()
+        move = max(0, min(move, len(self.moves)))
+
+        env = env or ReplayEnv(self)
+        if len(self._keys) != len(self.keyframes):
+            self._keys = [k.move for k in self.keyframes]
+        env.restore(self.keyframes[bisect.bisect_right(self._keys, move) - 1])
+        while env.mv_cnt < move and not env.done:
+            env.step(self.moves[env.mv_cnt])
+        return env
+
+    def to_bytes(self):
+        if not self.keyframes:
+            self.build_keyframes()
+
+        header = dict(
+            self.meta,
+            width=self.width,
+            length=self.length,
+            starting_pos=self.starting_pos,
+            seed=self.seed,
+            interval=self.interval,
+            n_moves=len(self.moves),
+            n_foods=len(self.foods),
+            n_keyframes=len(self.keyframes),
+        )
+        header = json.dumps(header).encode()
+
+        moves = pack_2bit([engine.ACTIONS.index(d) for d in self.moves])
+        foods = np.array(self.foods, dtype='<u4').tobytes()
+        cells = cells_mod.get_cells(self.width, self.length)
+        keyframes = b''.join(k.to_bytes(cells) for k in self.keyframes)
+
+        return MAGIC + struct.pack('<I', len(header)) + header \
+            + zlib.compress(moves + foods + keyframes)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a py-snake replay')
+        offset = len(MAGIC)
+        (n,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        header = json.loads(data[offset:offset + n])
+        data = zlib.decompress(data[offset + n:])
+        offset = 0
+
+        width = header.pop('width')
+        length = header.pop('length')
+        n_moves = header.pop('n_moves')
+        size = (n_moves + 3) // 4
+        moves = [engine.ACTIONS[i]
+                 for i in unpack_2bit(data[offset:offset + size], n_moves)]
+        offset += size
+
+        n_foods = header.pop('n_foods')
+        foods = np.frombuffer(data, dtype='<u4', count=n_foods,
+                              offset=offset).tolist()
+        offset += 4 * n_foods
+
+        replay = cls(
+            width, length, header.pop('starting_pos'),
+            header.pop('seed'), interval=header.pop('interval'),
+            moves=moves, foods=foods,
+        )
+        cells = cells_mod.get_cells(width, length)
+        for _ in range(header.pop('n_keyframes')):
+            keyframe, offset = Keyframe.from_bytes(data, offset, cells)
+            replay.keyframes.append(keyframe)
+        replay.meta = header
+        return replay
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+class Recorder(object):
+    '''Records a `game.Game` as it's played'''
+    def __init__(self, width, length, starting_pos, seed=None, meta=None):
+        self.replay = Replay(width, length, starting_pos, seed, meta)
+
+    def record_move(self, direction):
+        self.replay.moves.append(direction)
+
+    def record_food(self, cell):
+        self.replay.foods.append(cell)
+
+    def save(self, directory):
+        '''Save the replay under directory, return its path'''
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        name = f'replay-{stamp}-{self.replay.seed}.snk'
+        path = os.path.join(directory, name)
+        self.replay.save(path)
+        return path
+
+
+def format_state(env):
+    '''The board as text: H head, o body, * food, . empty'''
+    cells = ['.'] * env.cells.size + [None]    # The wall last
+    for cell in env.snake.pos:
+        cells[cell] = 'o'
+    if env.food is not None:
+        cells[env.food] = '*'
+    cells[env.head()] = 'H'
+    return '\n'.join(''.join(cells[y * env.width:(y + 1) * env.width])
+                     for y in range(env.length))
+
+
+def view(replay, move=0, speed=10.0):
+    '''
+    Play the replay in a window
+
+    Keys: space pauses, left/right step a move, up/down double/halve the
+    speed (moves per second), digits then enter jump to a move, escape quits.
+    '''
+    import pygame
+
+    import board
+    import game
+    import render
+
+    dim = max(config.board_size // max(replay.width, replay.length), 1)
+    config.space_dim = (dim, dim)
+    size = (replay.width * dim, replay.length * dim)
+
+    pygame.init()
+    screen = pygame.display.set_mode(size)
+    pygame.display.set_caption('PySnake Replay')
+    clock = pygame.time.Clock()
+
+    b = board.Board(max(size))
+    renderer = render.Renderer(screen, b)
+    env = replay.seek(move)
+    # The board may be wider or longer than the game's, so its cells are
+    # numbered differently
+    to_board = [b.cell(pos) for pos in env.cells.positions[:-1]] \
+        + [b.cells.wall]
+
+    paused = False
+    typed = ''
+    position = float(env.mv_cnt)
+    fps = 60
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+            if event.type != pygame.KEYDOWN:
+                continue
+            if event.key == pygame.K_ESCAPE:
+                pygame.quit()
+                return
+            elif event.key == pygame.K_SPACE:
+                paused = not paused
+            elif event.key == pygame.K_UP:
+                speed *= 2
+            elif event.key == pygame.K_DOWN:
+                speed /= 2
+            elif event.key == pygame.K_RIGHT:
+                position = env.mv_cnt + 1
+            elif event.key == pygame.K_LEFT:
+                position = env.mv_cnt - 1
+            elif event.unicode.isdigit():
+                typed += event.unicode
+            elif event.key == pygame.K_RETURN and typed:
+                position = int(typed)
+                typed = ''
+
+        if not paused:
+            position += speed / fps
+        position = max(0.0, min(position, float(len(replay))))
+
+        target = int(position)
+        if target < env.mv_cnt or target - env.mv_cnt > replay.interval:
+            env = replay.seek(target, env)
+        while env.mv_cnt < target and not env.done:
+            env.step(replay.moves[env.mv_cnt])
+
+        # Mirror the env's state on the board's grid
+        b.clear()
+        for cell in env.snake.pos:
+            b.set_state(to_board[cell], board.BODY)
+        b.set_state(to_board[env.head()], board.HEAD)
+        if env.food is not None:
+            b.set_state(to_board[env.food], board.FOOD)
+
+        label = f'{env.mv_cnt}/{len(replay)} x{speed:g}'
+        if typed:
+            label += f' > {typed}'
+        text = game.Text(label, (10, 10), size=16, anchor='topleft')
+        pygame.display.update(renderer.draw(None, [text]))
+        clock.tick(fps)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-replay')
+    parser.add_argument('path')
+    parser.add_argument('--move', type=int, default=0,
+                        help='move to start at')
+    parser.add_argument('--speed', type=float, default=10.0,
+                        help='moves per second')
+    parser.add_argument('--headless', action='store_true', default=False,
+                        help='print the board at --move instead of playing')
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    if args.headless:
+        env = replay.seek(args.move)
+        print(f'Move {env.mv_cnt}/{len(replay)}, score {env.get_score()}, '
+              f'cause: {replay.meta.get("cause")}')
+        print(format_state(env))
+    else:
+        view(replay, args.move, args.speed)
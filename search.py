@@ -0,0 +1,361 @@
+'''
+Lookahead search AI: expectimax over future food placements
+
+Unlike the path planners, which only plan to the current food, the search
+looks several moves ahead, including where food could appear next: eating
+leads to a chance node averaging over a sample of the free cells the food
+could respawn on (as `Game.reset_food` picks uniformly). Iterative deepening
+keeps to a per-move time budget. Eating is rewarded, discounted by how far
+ahead it is; leaves are scored by the distance to the food and whether the
+head can still reach the tail.
+
+Search states are cheap to branch: the body is a window onto a trail of head
+cells shared with the parent (copied only when a sibling has already
+extended it), occupancy is a bitset (an immutable int, see reachability.py)
+and the Zobrist hash is updated with a few xors per move. Values are cached
+in a bounded transposition table, kept between moves.
+
+    python -m search --games 10 --budget_ms 20
+'''
+import argparse
+import collections
+import logging
+import random
+import time
+
+import cells as cells_mod
+import config
+import engine
+import reachability
+
+
+DEAD = -1e6         # Value of a dead snake
+FOOD = 100          # Reward for eating
+TRAPPED = 500       # Penalty for a head that can't reach the tail
+DISCOUNT = 0.95     # Per move, so food sooner is worth more
+
+
+class Timeout(Exception):
+    '''The search ran out of its time budget'''
+    pass
+
+
+class TranspositionTable(object):
+    '''Bounded map of state hash -> (depth, value), evicting the LRU entry'''
+    def __init__(self, max_size=2 ** 18):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, depth):
+        '''The value stored for key if searched at least depth deep'''
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < depth:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, depth, value):
+        self._entries[key] = (depth, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+
+class State(object):
+    '''
+    A position in the search
+
+    The body is trail[lo:hi] (tail first); food is a cell, or None once eaten
+    until the chance node places the next (pending) or the board is full.
+    '''
+    __slots__ = ('trail', 'lo', 'hi', 'occupied', 'food', 'pending', 'dead',
+                 'hash')
+
+    def __init__(self, trail, lo, hi, occupied, food, pending, dead, hash):
+        self.trail = trail
+        self.lo = lo
+        self.hi = hi
+        self.occupied = occupied
+        self.food = food
+        self.pending = pending
+        self.dead = dead
+        self.hash = hash
+
+    def head(self):
+        return self.trail[self.hi - 1]
+
+    def tail(self):
+        return self.trail[self.lo]
+
+    def __len__(self):
+        return self.hi - self.lo
+
+
+class Searcher(object):
+    '''Expectimax search for the next move on a width x length board'''
+    def __init__(self, width, length, budget=None, samples=3, max_depth=12,
+                 table_size=2 ** 18, seed=0):
+        self.width = width
+        self.length = length
+        self.budget = config.search_budget if budget is None else budget
+        self.samples = samples      # Food placements tried per chance node
+        self.max_depth = max_depth
+        self.table = TranspositionTable(table_size)
+
+        self.cells = cells_mod.get_cells(width, length)
+        self.reach = reachability.get_reachability(width, length)
+        self.bit = self.reach.bit
+
+        # Zobrist keys per cell for the body, head, tail and food
+        rng = random.Random(seed)
+        n = self.cells.size
+        self._body_keys = [rng.getrandbits(64) for _ in range(n)]
+        self._head_keys = [rng.getrandbits(64) for _ in range(n)]
+        self._tail_keys = [rng.getrandbits(64) for _ in range(n)]
+        self._food_keys = [rng.getrandbits(64) for _ in range(n)]
+
+        # Expected distance to food placed at random, for leaves that ate
+        self._food_distance = (width + length) / 3
+
+        self._deadline = None
+        self.nodes = 0          # Nodes searched, over all moves
+        self.seconds = 0        # Time spent searching
+        self.depth = 0          # Depth completed by the last search
+
+    def nodes_per_sec(self):
+        return self.nodes / self.seconds if self.seconds else 0
+
+    def root(self, body, food):
+        '''The state of a body (head first) and food (or None) cells'''
+        trail = list(body)[::-1]
+        h = self._head_keys[trail[-1]] ^ self._tail_keys[trail[0]]
+        occupied = 0
+        for c in trail:
+            occupied |= self.bit(c)
+            h ^= self._body_keys[c]
+        if food is not None:
+            h ^= self._food_keys[food]
+        return State(trail, 0, len(trail), occupied, food, False, False, h)
+
+    def move(self, state, cell):
+        '''The state after the head moves to cell (an in-board neighbor)'''
+        trail, lo, hi = state.trail, state.lo, state.hi
+        head, tail = trail[hi - 1], trail[lo]
+        h = state.hash ^ self._head_keys[head] ^ self._head_keys[cell]
+        occupied = state.occupied
+        food = state.food
+        pending = cell == food
+
+        if pending:
+            h ^= self._food_keys[food]
+            food = None
+        else:
+            # The tail moves on (before the head moves in)
+            occupied &= ~self.bit(tail)
+            lo += 1
+            new_tail = trail[lo] if lo < hi else cell
+            h ^= self._body_keys[tail] ^ self._tail_keys[tail] \
+                ^ self._tail_keys[new_tail]
+
+        bit = self.bit(cell)
+        dead = bool(occupied & bit)
+        occupied |= bit
+        h ^= self._body_keys[cell]
+
+        # Copy on write: a sibling may have extended the shared trail
+        if len(trail) != hi:
+            trail = trail[lo:hi]
+            lo, hi = 0, len(trail)
+        trail.append(cell)
+        return State(trail, lo, hi + 1, occupied, food, pending, dead, h)
+
+    def place_food(self, state, cell):
+        '''The state with the pending food placed on cell'''
+        return State(state.trail, state.lo, state.hi, state.occupied, cell,
+                     False, False, state.hash ^ self._food_keys[cell])
+
+    def moves(self, state):
+        '''Cells the head can move to (not back onto the neck)'''
+        trail, hi = state.trail, state.hi
+        neck = trail[hi - 2] if hi - state.lo > 1 else None
+        return [c for c in self.cells.neighbors[trail[hi - 1]] if c != neck]
+
+    def sample_food(self, state):
+        '''Up to samples free cells the food could respawn on'''
+        free = self.cells.size - len(state)
+        if free <= 0:
+            return []
+        occupied, bit = state.occupied, self.bit
+        if free <= 4 * self.samples:
+            cells = [c for c in range(self.cells.size)
+                     if not occupied & bit(c)]
+            return cells if free <= self.samples \
+                else random.Random(state.hash).sample(cells, self.samples)
+
+        # Seeded by the state, so a chance node samples the same cells when
+        # it's searched again
+        rng = random.Random(state.hash)
+        cells = set()
+        while len(cells) < self.samples:
+            c = rng.randrange(self.cells.size)
+            if not occupied & bit(c):
+                cells.add(c)
+        return sorted(cells)
+
+    def evaluate(self, state):
+        '''Score a leaf by the distance to the food and if it's trapped'''
+        head, tail = state.head(), state.tail()
+        if state.food is not None:
+            value = -self.cells.distance(head, state.food)
+        else:
+            value = -self._food_distance
+
+        tail_bit = self.bit(tail)
+        free = self.reach.board & ~state.occupied | tail_bit
+        if not self.reach.flood(self.bit(head), free, tail_bit) & tail_bit:
+            value -= TRAPPED
+        return value
+
+    def value(self, state, depth):
+        '''Expected value of state (after a move) with depth moves to go'''
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self._deadline:
+            raise Timeout()
+
+        if state.dead:
+            return DEAD
+        reward = FOOD if state.pending else 0
+        if depth == 0:
+            return reward + self.evaluate(state)
+
+        value = self.table.get(state.hash, depth)
+        if value is not None:
+            return value
+
+        if state.pending:
+            cells = self.sample_food(state)
+            if not cells:
+                value = reward      # Board full
+            else:
+                value = reward + DISCOUNT * sum(
+                    self.best(self.place_food(state, c), depth)[0]
+                    for c in cells
+                ) / len(cells)
+        else:
+            value = DISCOUNT * self.best(state, depth)[0]
+
+        self.table.put(state.hash, depth, value)
+        return value
+
+    def best(self, state, depth):
+        '''(value, cell) of the best move from state'''
+        best = (DEAD, None)
+        for cell in self.moves(state):
+            value = self.value(self.move(state, cell), depth - 1)
+            if value > best[0] or best[1] is None:
+                best = (value, cell)
+        return best
+
+    def search(self, body, food):
+        '''The cell to move the head of body (cells) to next, or None'''
+        start = time.perf_counter()
+        self._deadline = start + self.budget
+        nodes = self.nodes
+
+        root = self.root(body, food)
+        cell = None
+        self.depth = 0
+        try:
+            for depth in range(1, self.max_depth + 1):
+                cell = self.best(root, depth)[1]
+                self.depth = depth
+        except Timeout:
+            pass
+
+        seconds = time.perf_counter() - start
+        self.seconds += seconds
+        logging.getLogger(self.__class__.__name__).debug(
+            f'Searched {self.nodes - nodes} nodes to depth {self.depth} '
+            f'in {seconds * 1000:.1f}ms'
+        )
+        return cell
+
+
+class SearchPolicy(object):
+    '''Drives an `engine.SnakeEnv` with a `Searcher`'''
+    def __init__(self, budget=None, **kwargs):
+        self.budget = budget
+        self.kwargs = kwargs
+        self.searcher = None
+
+    def __call__(self, env):
+        dims = (env.width, env.length)
+        if self.searcher is None \
+                or (self.searcher.width, self.searcher.length) != dims:
+            self.searcher = Searcher(env.width, env.length, self.budget,
+                                     **self.kwargs)
+        nxt = self.searcher.search(env.snake.pos, env.food)
+        if nxt is None:
+            return None
+        return env.cells.direction(env.head(), nxt)
+
+
+def run(games, width, length, budget, seed=0, max_moves=None, **kwargs):
+    '''Play games headless, logging scores and search throughput'''
+    log = logging.getLogger('search')
+    policy = SearchPolicy(budget, **kwargs)
+    env = engine.SnakeEnv(width, length)
+    results = []
+    for i in range(games):
+        info = env.play(policy, seed=seed + i, max_moves=max_moves,
+                        max_stall=width * length)
+        searcher = policy.searcher
+        log.info(f'Game {i}: score {info["score"]} in {info["mv_cnt"]} moves '
+                 f'({info["cause"]}), {searcher.nodes_per_sec():,.0f} '
+                 f'nodes/s')
+        results.append(info)
+
+    table = searcher.table
+    lookups = table.hits + table.misses
+    log.info(f'{searcher.nodes:,} nodes in {searcher.seconds:.1f}s: '
+             f'{searcher.nodes_per_sec():,.0f} nodes/s; transposition table '
+             f'{len(table):,} entries, {table.hits / max(lookups, 1):.0%} '
+             f'hits, {table.evictions:,} evictions')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-search')
+    parser.add_argument('--games', type=int, default=5)
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--length', type=int, default=20)
+    parser.add_argument('--budget_ms', type=float,
+                        default=config.search_budget * 1000,
+                        help='search time per move')
+    parser.add_argument('--samples', type=int, default=3,
+                        help='food placements tried per chance node')
+    parser.add_argument('--table_size', type=int, default=2 ** 18,
+                        help='transposition table entries')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max_moves', type=int, default=None)
+    parser.add_argument('--debugging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    log_lvl = logging.DEBUG if args.debugging else logging.INFO
+    log_fmt = '[%(asctime)s] %(name)s %(levelname)s> %(message)s'
+    logging.basicConfig(format=log_fmt, level=log_lvl)
+
+    run(args.games, args.width, args.length, args.budget_ms / 1000, args.seed,
+        args.max_moves, samples=args.samples, table_size=args.table_size)
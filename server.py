@@ -0,0 +1,457 @@
+'''
+Headless game server
+
+Hosts many `engine.SnakeEnv` sessions over TCP or a Unix socket, for bots
+and viewers. A session is either stepped by its client (STEP advances the
+game and replies with the diff), or ticked by the server every tick_ms, in
+which case STEP sets its next move and diffs go to subscribers.
+
+Messages are a uint32 length (of the rest, little-endian), a uint8 type and
+a payload:
+
+    NEW        JSON {width, length, seed, tick_ms}    -> SESSION
+    STEP       uint32 session, uint8 action           -> DIFF (stepped)
+    OBSERVE    uint32 session                         -> STATE
+    SUBSCRIBE  uint32 session                         -> STATE, then DIFFs
+    RESET      uint32 session, int64 seed (-1: none)  -> STATE
+    CLOSE      uint32 session
+    STATS                                             -> INFO
+
+    SESSION    uint32 session
+    STATE      JSON {session, width, length, body, food, direction, ...}
+    DIFF       uint32 session, uint32 move, uint8 event, uint32 score,
+               int32 head, vacated tail and new food cells (-1: none)
+    INFO       JSON {sessions, ticks (moves made), cpu_seconds, ...}
+    ERROR      utf-8 message
+
+Actions index engine.ACTIONS (KEEP to keep going) and cells are flat
+(y * width + x). Boards over max_cells cells get an ERROR. Replies queue
+per connection up to max_queue messages; requests wait for room (so a
+client that doesn't read is throttled by TCP), while a subscriber that
+falls behind misses diffs and gets a fresh STATE once its queue has room
+again.
+
+    python -m server --port 8765
+    python -m server --unix /tmp/py-snake.sock
+'''
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import struct
+import time
+
+import numpy as np
+
+import config
+import engine
+import profiler
+
+
+# Client requests
+NEW, STEP, OBSERVE, SUBSCRIBE, RESET, CLOSE, STATS = range(1, 8)
+# Server replies
+SESSION, STATE, DIFF, INFO, ERROR = range(64, 69)
+
+KEEP = 255      # Action: keep going
+EVENTS = (None, 'ate', 'wall', 'ate itself', 'board full')
+
+HEADER = struct.Struct('<IB')
+SESSION_MSG = struct.Struct('<I')
+STEP_MSG = struct.Struct('<IB')
+RESET_MSG = struct.Struct('<Iq')
+DIFF_MSG = struct.Struct('<IIBIiii')
+
+
+def pack(kind, payload=b''):
+    return HEADER.pack(len(payload) + 1, kind) + payload
+
+
+async def read_message(reader):
+    '''The next (type, payload) from reader'''
+    n, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return kind, await reader.readexactly(n - 1)
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class Session(object):
+    '''One game, stepped by a client or ticked by the server'''
+    def __init__(self, sid, width, length, seed=None, tick_ms=0,
+                 max_cells=None):
+        for name, value in (('width', width), ('length', length),
+                            ('seed', seed)):
+            if value is not None and not is_int(value):
+                raise ValueError(f'{name} must be an integer')
+        if not is_int(tick_ms) or tick_ms < 0:
+            raise ValueError('tick_ms must be a non-negative integer')
+
+        self.id = sid
+        self.env = engine.SnakeEnv(width, length)
+        max_cells = max_cells or config.server_max_cells
+        if self.env.width * self.env.length > max_cells:
+            raise ValueError(f'A {self.env.width}x{self.env.length} board is '
+                             f'over the limit of {max_cells} cells')
+        if any(not self.env.is_inside(pos) for pos in self.env.starting_pos):
+            raise ValueError(f'A {self.env.width}x{self.env.length} board is '
+                             f'too small for the starting position')
+        self.env.reset(seed)
+        self.tick = tick_ms / 1000
+        self.action = None          # Next move of a ticked session
+        self.scheduled = False
+        self.subscribers = {}       # Connection -> missed a diff
+
+    def cell(self, cell):
+        '''cell on the wire: -1 for none or the wall'''
+        if cell is None or cell == self.env.cells.wall:
+            return -1
+        return cell
+
+    def state(self):
+        env = self.env
+        return pack(STATE, json.dumps(dict(
+            session=self.id,
+            width=env.width,
+            length=env.length,
+            body=[self.cell(cell) for cell in env.snake.pos],
+            food=self.cell(env.food),
+            direction=env.direction,
+            score=env.get_score(),
+            move=env.mv_cnt,
+            done=env.done,
+            cause=env.cause,
+        )).encode())
+
+    def step(self, action=None):
+        '''Advance the game, return the DIFF message'''
+        env = self.env
+        tail, food = env.snake.last(), env.food
+        reward, done, _ = env.step(action)
+
+        if done:
+            event = EVENTS.index(env.cause)
+        else:
+            event = EVENTS.index('ate') if reward > 0 else 0
+        vacated = tail if tail not in env.snake.pos else None
+        return pack(DIFF, DIFF_MSG.pack(
+            self.id, env.mv_cnt, event, env.get_score(),
+            self.cell(env.head()), self.cell(vacated),
+            self.cell(env.food) if env.food != food else -1,
+        ))
+
+
+class Connection(object):
+    '''A client connection, with a bounded queue of outgoing messages'''
+    def __init__(self, reader, writer, max_queue):
+        self.reader = reader
+        self.writer = writer
+        self.out = asyncio.Queue(max_queue)
+        self.subscriptions = set()
+
+    async def send(self, message):
+        '''Queue message, waiting for room'''
+        await self.out.put(message)
+
+    def offer(self, message):
+        '''Queue message if there's room, return whether it was queued'''
+        try:
+            self.out.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def write_loop(self):
+        while True:
+            message = await self.out.get()
+            if message is None:
+                return
+            self.writer.write(message)
+            # Write out whatever else is queued before waiting on the socket
+            while not self.out.empty():
+                message = self.out.get_nowait()
+                if message is None:
+                    return
+                self.writer.write(message)
+            await self.writer.drain()
+
+
+class GameServer(object):
+    '''Hosts sessions, ticking the timed ones from a single scheduler'''
+    def __init__(self, max_queue=256, max_cells=None):
+        self.max_queue = max_queue
+        self.max_cells = max_cells or config.server_max_cells
+        self.sessions = {}
+        self.ticks = 0
+        self.lateness = profiler.RingBuffer(4096)  # Ticks past due (s)
+        self._next_id = 1
+        self._timers = []       # Heap of (due, session id)
+        self._wakeup = asyncio.Event()
+
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def schedule(self, session, due):
+        heapq.heappush(self._timers, (due, session.id))
+        session.scheduled = True
+        self._wakeup.set()
+
+    def publish(self, session, diff):
+        '''Send diff to the session's subscribers, resyncing lagging ones'''
+        state = None
+        for conn, missed in session.subscribers.items():
+            if missed:
+                state = state or session.state()
+                if conn.offer(state):
+                    session.subscribers[conn] = False
+            elif not conn.offer(diff):
+                session.subscribers[conn] = True
+
+    async def run_timers(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._timers:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            delay = self._timers[0][0] - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            # Tick every session that's due, yielding now and then
+            now = loop.time()
+            n = 0
+            while self._timers and self._timers[0][0] <= now:
+                due, sid = heapq.heappop(self._timers)
+                session = self.sessions.get(sid)
+                if session is None or session.env.done:
+                    if session is not None:
+                        session.scheduled = False
+                    continue
+
+                self.lateness.append(now - due)
+                diff = session.step(session.action)
+                session.action = None
+                self.ticks += 1
+                self.publish(session, diff)
+
+                if session.env.done:
+                    session.scheduled = False
+                else:
+                    # Fall behind rather than burst to catch up
+                    nxt = max(due + session.tick, now)
+                    heapq.heappush(self._timers, (nxt, sid))
+
+                n += 1
+                if n % 256 == 0:
+                    await asyncio.sleep(0)
+
+    def stats(self):
+        lateness = self.lateness.values() * 1000
+        pct = (lambda q: float(np.percentile(lateness, q))) \
+            if len(lateness) else (lambda q: 0.0)
+        return dict(
+            sessions=len(self.sessions),
+            ticked=sum(1 for s in self.sessions.values() if s.scheduled),
+            ticks=self.ticks,
+            cpu_seconds=time.process_time(),
+            wall_seconds=time.monotonic(),
+            lateness_ms=dict(p50=pct(50), p99=pct(99)),
+        )
+
+    async def handle(self, reader, writer):
+        conn = Connection(reader, writer, self.max_queue)
+        write_task = asyncio.create_task(conn.write_loop())
+        try:
+            while True:
+                kind, payload = await read_message(reader)
+                try:
+                    reply = self.dispatch(conn, kind, payload)
+                except (KeyError, ValueError, RuntimeError,
+                        struct.error) as e:
+                    reply = pack(ERROR, str(e).encode())
+                if reply is not None:
+                    await conn.send(reply)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for session in conn.subscriptions:
+                session.subscribers.pop(conn, None)
+            write_task.cancel()
+            writer.close()
+
+    def get(self, payload):
+        (sid,) = SESSION_MSG.unpack_from(payload)
+        try:
+            return self.sessions[sid]
+        except KeyError:
+            raise KeyError(f'No session {sid}')
+
+    def dispatch(self, conn, kind, payload):
+        '''Handle a request, return the reply (or None)'''
+        if kind == NEW:
+            opts = json.loads(payload or b'{}')
+            if not isinstance(opts, dict):
+                raise ValueError('NEW takes a JSON object')
+            try:
+                session = Session(
+                    self._next_id, opts.get('width'), opts.get('length'),
+                    opts.get('seed'), opts.get('tick_ms', 0), self.max_cells,
+                )
+            except MemoryError:
+                raise ValueError('Not enough memory for this board')
+            self._next_id += 1
+            self.sessions[session.id] = session
+            if session.tick > 0:
+                self.schedule(session,
+                              asyncio.get_running_loop().time() + session.tick)
+            return pack(SESSION, SESSION_MSG.pack(session.id))
+
+        elif kind == STEP:
+            sid, action = STEP_MSG.unpack(payload)
+            if not (action < len(engine.ACTIONS) or action == KEEP):
+                raise ValueError(f'Unknown action {action}')
+            session = self.get(payload)
+            action = None if action == KEEP else engine.ACTIONS[action]
+            if session.tick > 0:
+                session.action = action
+                return None
+            diff = session.step(action)
+            self.ticks += 1
+            self.publish(session, diff)
+            return diff
+
+        elif kind == OBSERVE:
+            return self.get(payload).state()
+
+        elif kind == SUBSCRIBE:
+            session = self.get(payload)
+            session.subscribers[conn] = False
+            conn.subscriptions.add(session)
+            return session.state()
+
+        elif kind == RESET:
+            sid, seed = RESET_MSG.unpack(payload)
+            session = self.get(payload)
+            session.env.reset(None if seed < 0 else seed)
+            session.action = None
+            if session.tick > 0 and not session.scheduled:
+                self.schedule(session,
+                              asyncio.get_running_loop().time() + session.tick)
+            return session.state()
+
+        elif kind == CLOSE:
+            session = self.sessions.pop(self.get(payload).id)
+            for sub in session.subscribers:
+                sub.subscriptions.discard(session)
+            return None
+
+        elif kind == STATS:
+            return pack(INFO, json.dumps(self.stats()).encode())
+
+        raise ValueError(f'Unknown message type {kind}')
+
+    async def serve(self, host='127.0.0.1', port=8765, unix=None):
+        timers = asyncio.create_task(self.run_timers())
+        if unix is not None:
+            server = await asyncio.start_unix_server(self.handle, unix)
+            self.log.info(f'Listening on {unix}')
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            self.log.info(f'Listening on {host}:{port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            timers.cancel()
+
+
+class Client(object):
+    '''A minimal client for one connection to the server'''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=8765, unix=None):
+        if unix is not None:
+            reader, writer = await asyncio.open_unix_connection(unix)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def send(self, kind, payload=b''):
+        self.writer.write(pack(kind, payload))
+
+    async def read(self):
+        '''The next (type, payload); raises RuntimeError on ERROR'''
+        kind, payload = await read_message(self.reader)
+        if kind == ERROR:
+            raise RuntimeError(payload.decode())
+        return kind, payload
+
+    async def new(self, width=None, length=None, seed=None, tick_ms=0):
+        opts = dict(width=width, length=length, seed=seed, tick_ms=tick_ms)
+        self.send(NEW, json.dumps(opts).encode())
+        _, payload = await self.read()
+        return SESSION_MSG.unpack(payload)[0]
+
+    async def step(self, sid, action=KEEP):
+        '''Step a client-stepped session, return the decoded diff'''
+        self.send(STEP, STEP_MSG.pack(sid, action))
+        _, payload = await self.read()
+        return DIFF_MSG.unpack(payload)
+
+    async def observe(self, sid):
+        self.send(OBSERVE, SESSION_MSG.pack(sid))
+        _, payload = await self.read()
+        return json.loads(payload)
+
+    async def subscribe(self, sid):
+        '''Subscribe to a session's diffs, return its current state'''
+        self.send(SUBSCRIBE, SESSION_MSG.pack(sid))
+        _, payload = await self.read()
+        return json.loads(payload)
+
+    async def stats(self):
+        self.send(STATS)
+        _, payload = await self.read()
+        return json.loads(payload)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', default=None,
+                        help='listen on this Unix socket instead')
+    parser.add_argument('--max_queue', type=int, default=256,
+                        help='messages queued per connection at most')
+    parser.add_argument('--max_cells', type=int,
+                        default=config.server_max_cells,
+                        help='largest board a session may ask for, in cells')
+    parser.add_argument('--debugging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    log_lvl = logging.DEBUG if args.debugging else logging.INFO
+    log_fmt = '[%(asctime)s] %(name)s %(levelname)s> %(message)s'
+    logging.basicConfig(format=log_fmt, level=log_lvl)
+
+    if args.unix is not None and os.path.exists(args.unix):
+        os.remove(args.unix)
+    server = GameServer(args.max_queue, args.max_cells)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -1,17 +1,31 @@
+import collections
+
 import config
 
 
 class FIFOQueue(object):
-    '''A First-in First-out priority Queue of fixed capacity'''
-    def __init__(self, *args, capacity: int):
-        self._data = list(args)
+    '''
+    A First-in First-out priority Queue of fixed capacity
+
+    Backed by a deque (O(1) push to the front and pop from the back) plus a
+    count of each item, so membership and duplicate checks are O(1). Queues
+    of ints below size (e.g. board cells, see cells.py) keep the counts in a
+    list indexed by item, any other items in a Counter.
+    '''
+    def __init__(self, *args, capacity: int, size: int = None):
+        self._data = collections.deque()
+        self._counts = collections.Counter() if size is None else [0] * size
+        self._size = size
+        self._duplicates = 0    # Number of items that repeat an earlier one
+        for item in args:
+            self._push_back(item)
         self.set_capacity(capacity)
 
     def __repr__(self):
-        return self._data.__repr__()
+        return list(self._data).__repr__()
 
     def __str__(self):
-        return self._data.__str__()
+        return list(self._data).__str__()
 
     def __iter__(self):
         return self._data.__iter__()
@@ -19,16 +33,52 @@ class FIFOQueue(object):
     def __len__(self):
         return self._data.__len__()
 
+    def __contains__(self, item):
+        return self._counts[item] > 0
+
     def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self._data)[i]
         return self._data[i]
 
+    def _count(self, item):
+        self._counts[item] += 1
+        if self._counts[item] > 1:
+            self._duplicates += 1
+
+    def _push_front(self, item):
+        self._data.appendleft(item)
+        self._count(item)
+
+    def _push_back(self, item):
+        self._data.append(item)
+        self._count(item)
+
+    def _pop_back(self):
+        item = self._data.pop()
+        self._counts[item] -= 1
+        if self._counts[item] > 0:
+            self._duplicates -= 1
+        elif self._size is None:
+            del self._counts[item]
+        return item
+
+    def count(self, item):
+        return self._counts[item]
+
+    def has_duplicates(self):
+        '''Check if any item is in the queue more than once'''
+        return self._duplicates > 0
+
     def trim(self, n: int):
         '''Return the list trimmed to capacity n'''
         if n <= 0:
             raise ValueError(f'Expected n to be >= 1, got: {n}')
 
-        res = self._data[n:]
-        self._data = self._data[:n]
+        res = []
+        while len(self._data) > n:
+            res.append(self._pop_back())
+        res.reverse()
         return res
 
     def set_capacity(self, n: int):
@@ -59,25 +109,29 @@ class FIFOQueue(object):
         Pops and returns the oldest item if at capacity (before adding item).
         Otherwise returns None
         '''
-        res = self._data.pop() if self.at_capacity() else None
+        res = self._pop_back() if self.at_capacity() else None
 
-        self._data = [item] + self._data
+        self._push_front(item)
 
         return res
 
     def pop(self):
-        return self._data.pop()
+        return self._pop_back()
 
     def first(self):
         return self._data[0]
 
     def last(self):
-        return self._data[len(self._data)]
+        return self._data[-1]
 
 
 class Snake(object):
-    def __init__(self, pos):
-        self.pos = FIFOQueue(*pos, capacity=len(pos))
+    '''
+    A snake's body, head first: cells below size if given (see FIFOQueue),
+    otherwise positions
+    '''
+    def __init__(self, pos, size=None):
+        self.pos = FIFOQueue(*pos, capacity=len(pos), size=size)
         self.head_color = config.snake_head_color
         self.color = config.snake_color
 
@@ -91,7 +145,13 @@ class Snake(object):
         return self.pos.__iter__()
 
     def __getitem__(self, i):
-        return self.__getitem__(i)
+        return self.pos[i]
+
+    def __len__(self):
+        return self.pos.__len__()
+
+    def __contains__(self, pos):
+        return pos in self.pos
 
     def add(self, new_pos):
         return self.pos.add(new_pos)
@@ -0,0 +1,170 @@
+'''
+Evaluate the AI over many headless games
+
+Runs every combination of planner, board size, space dimension and seed in a
+process pool and streams one CSV row per game. Re-running with the same
+output file skips the games already in it, so an interrupted sweep resumes
+where it stopped.
+
+    python -m tournament --seeds 1000 --board_size 1200 600 --planner bfs astar
+'''
+import argparse
+import csv
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+
+import config
+import engine
+import planner
+import search
+
+
+FIELDS = [
+    'planner', 'board_size', 'space_dim', 'width', 'length', 'seed',
+    'score', 'mv_cnt', 'cause', 'seconds',
+]
+
+# Columns identifying a game, used to resume a sweep
+KEY_FIELDS = ['planner', 'board_size', 'space_dim', 'seed']
+
+
+def play_game(job):
+    '''
+    Play one game, return its CSV row
+
+    Games end as 'stalled' after max_stall moves without eating (default: a
+    move per cell, enough to reach any food).
+    '''
+    planner_name, board_size, space_dim, seed, max_moves, max_stall = job
+    width = board_size // space_dim
+    env = engine.SnakeEnv(width, width)
+    if planner_name == 'search':
+        policy = search.SearchPolicy()
+    else:
+        policy = planner.PlannerPolicy(planner_name)
+
+    start = time.perf_counter()
+    info = env.play(policy, seed=seed, max_moves=max_moves,
+                    max_stall=max_stall or width * width)
+    seconds = time.perf_counter() - start
+
+    # Deaths while the AI had no path to the food
+    cause = info['cause']
+    if cause in ('wall', 'ate itself') and planner_name != 'search' \
+            and not policy.has_path():
+        cause = 'no path'
+
+    return dict(
+        planner=planner_name,
+        board_size=board_size,
+        space_dim=space_dim,
+        width=width,
+        length=width,
+        seed=seed,
+        score=info['score'],
+        mv_cnt=info['mv_cnt'],
+        cause=cause,
+        seconds=f'{seconds:.6f}',
+    )
+
+
+def get_key(row):
+    return tuple(str(row[field]) for field in KEY_FIELDS)
+
+
+def read_done(path):
+    '''
+    Keys of the games already recorded in path
+
+    A last row cut short by an interrupted sweep is truncated from the file,
+    so its game is played again and new rows start on a line of their own.
+    '''
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            logging.getLogger('tournament').warning(
+                f'Dropping an incomplete row from {path}'
+            )
+            f.truncate(end)
+    lines = data[:end].decode().splitlines(keepends=True)
+    return {get_key(row) for row in csv.DictReader(lines)}
+
+
+def get_jobs(planners, board_sizes, space_dims, seeds, max_moves,
+             max_stall=None, done=()):
+    for name, size, dim, seed in itertools.product(
+            planners, board_sizes, space_dims, seeds):
+        if size // dim <= max(max(p) for p in config.starting_pos):
+            continue    # Board too small for the starting position
+        if get_key(dict(planner=name, board_size=size, space_dim=dim,
+                        seed=seed)) in done:
+            continue
+        yield (name, size, dim, seed, max_moves, max_stall)
+
+
+def run(out, planners, board_sizes, space_dims, seeds, max_moves=None,
+        max_stall=None, workers=None, chunksize=4):
+    '''Run the sweep, appending rows to out; returns the number of games'''
+    log = logging.getLogger('tournament')
+
+    done = read_done(out)
+    jobs = list(get_jobs(
+        planners, board_sizes, space_dims, seeds, max_moves, max_stall, done
+    ))
+    log.info(f'{len(done)} games done, {len(jobs)} to play')
+
+    new_file = not os.path.exists(out) or os.path.getsize(out) == 0
+    start = time.perf_counter()
+    n = 0
+    with open(out, 'a', newline='') as f, \
+            multiprocessing.Pool(workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        for row in pool.imap_unordered(play_game, jobs, chunksize):
+            writer.writerow(row)
+            f.flush()   # Rows are on disk as soon as they're played
+            n += 1
+            if n % 100 == 0:
+                log.info(f'{n}/{len(jobs)} games played')
+
+    seconds = time.perf_counter() - start
+    log.info(f'Played {n} games in {seconds:.1f}s')
+    return n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('py-snake-tournament')
+    parser.add_argument('--out', default='tournament.csv')
+    parser.add_argument('--planner', nargs='+', default=['astar'],
+                        choices=list(planner.PLANNERS) + ['search'])
+    parser.add_argument('--board_size', nargs='+', type=int,
+                        default=[config.board_size])
+    parser.add_argument('--space_dim', nargs='+', type=int,
+                        default=[config.space_dim[0]])
+    parser.add_argument('--seeds', type=int, default=100,
+                        help='number of seeds per configuration')
+    parser.add_argument('--first_seed', type=int, default=0)
+    parser.add_argument('--max_moves', type=int, default=None)
+    parser.add_argument('--max_stall', type=int, default=None,
+                        help='moves without eating before a game is stalled '
+                             '(default: the number of cells)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes (default: one per core)')
+    parser.add_argument('--debugging', action='store_true', default=False)
+    args = parser.parse_args()
+
+    log_lvl = logging.DEBUG if args.debugging else logging.INFO
+    log_fmt = '[%(asctime)s] %(name)s %(levelname)s> %(message)s'
+    logging.basicConfig(format=log_fmt, level=log_lvl)
+
+    seeds = range(args.first_seed, args.first_seed + args.seeds)
+    run(args.out, args.planner, args.board_size, args.space_dim, seeds,
+        args.max_moves, args.max_stall, args.workers)
@@ -0,0 +1,124 @@
+'''
+Path planning off the frame thread
+
+`PlanWorker` runs a planner on a background thread. The game posts each move
+of the snake and requests plans without waiting; the worker mirrors the
+snake's body from the posted moves (so incremental planners see one
+consistent `blocked` container) and publishes its latest plan, tagged with
+the move it was made at, for the player to pick up on a later move. When
+moves are simulated faster than real time, the player can `wait` for the
+plan it requested instead.
+'''
+import collections
+import logging
+import queue
+import threading
+import time
+
+import cells as cells_mod
+import reachability
+import snake
+
+
+Plan = collections.namedtuple('Plan', ['move', 'target', 'path', 'seconds'])
+
+
+class PlanWorker(object):
+    '''Plans paths for a snake on a background thread'''
+    def __init__(self, planner, body, width, length, safety=True):
+        self.planner = planner
+        self.width = width
+        self.length = length
+        self.safety = safety
+        self.cells = cells_mod.get_cells(width, length)
+        self.reach = reachability.get_reachability(width, length) \
+            if safety else None
+
+        # The worker's copy of the body (cells), kept in step by moved()
+        self._body = snake.FIFOQueue(*body, capacity=body.get_capacity(),
+                                     size=self.cells.size + 1)
+        self._moves = 0
+        self._inbox = queue.SimpleQueue()
+        self._result = None
+        self._requests = 0      # Plan requests posted
+        self._answered = 0      # Requests planned, or dropped for a newer one
+        self._answer = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name='PlanWorker', daemon=True
+        )
+
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._inbox.put(None)
+        self._thread.join()
+
+    def moved(self, head, capacity):
+        '''Post a move of the snake (its new head and capacity)'''
+        self._inbox.put(('move', head, capacity))
+
+    def request(self, target):
+        '''Ask for a path to target; only the newest request is planned'''
+        self._requests += 1
+        self._inbox.put(('plan', target, self._requests))
+
+    def wait(self):
+        '''Block until the newest request has been planned'''
+        with self._answer:
+            self._answer.wait_for(lambda: self._answered >= self._requests)
+
+    def result(self):
+        '''The latest finished `Plan`, or None'''
+        return self._result
+
+    def _run(self):
+        while True:
+            messages = [self._inbox.get()]
+            while True:
+                try:
+                    messages.append(self._inbox.get_nowait())
+                except queue.Empty:
+                    break
+
+            target = None
+            requested = 0
+            for message in messages:
+                if message is None:
+                    return
+                if message[0] == 'move':
+                    self._move(*message[1:])
+                else:
+                    _, target, requested = message
+
+            if requested:
+                try:
+                    self._plan(target)
+                except Exception:
+                    self.log.exception(f'Planning to {target} failed')
+                with self._answer:
+                    self._answered = requested
+                    self._answer.notify_all()
+
+    def _move(self, head, capacity):
+        body = self._body
+        body.set_capacity(capacity)
+        tail = body.add(head)
+        self._moves += 1
+        self.planner.update([head] if tail is None else [head, tail])
+
+    def _plan(self, target):
+        start = time.perf_counter()
+        body = self._body
+        head = body.first()
+        if head == self.cells.wall:
+            return      # The snake left the board, the game is over
+        path = self.planner.find_cells(head, target, body, self.cells)
+        if self.safety:
+            free = self.reach.free_from_body(body)
+            path = self.reach.safe_path(body, path, free)
+        seconds = time.perf_counter() - start
+        self._result = Plan(self._moves, target, path, seconds)